@@ -1,8 +1,8 @@
 from flask import Flask
-from flask_login import LoginManager
+from flask_login import LoginManager, current_user
 from flask_socketio import SocketIO
 from config import Config
-from app.models import db, User
+from app.models import db
 import os
 
 login_manager = LoginManager()
@@ -16,11 +16,14 @@ def create_app(config_class=Config):
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
-    socketio.init_app(app, manage_session=False)
+    socketio.init_app(app, manage_session=False, message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
     
+    from app.passwords import password_hasher
+    password_hasher.init_app(app)
+    
     # Register blueprints
     from app.auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
@@ -75,13 +78,61 @@ def create_app(config_class=Config):
         
         db.session.commit()
     
+    from app.discovery_queue import discovery_queue
+    discovery_queue.init_app(app)
+    
+    from app.search_index import search_index
+    search_index.init_app(app)
+    
+    from app.unread_counters import unread_badges
+    unread_badges.init_app(app)
+    
+    from app.presence import presence
+    presence.init_app(app)
+    
+    from app.activity import activity
+    activity.init_app(app)
+    
+    from app.signaling import ice_batcher
+    ice_batcher.init_app(app)
+    
+    from app.calls import call_registry
+    call_registry.init_app(app)
+    
+    from app.event_log import signal_log
+    signal_log.init_app(app)
+    
+    from app.identity_cache import identity_cache
+    identity_cache.init_app(app)
+    
+    from app.social_graph import social_graph
+    social_graph.init_app(app)
+    
+    from app.groq_service import groq_service
+    groq_service.init_app(app)
+    
+    from app.ai_cache import ai_cache
+    ai_cache.init_app(app)
+    
+    from app.ai_jobs import ai_jobs
+    ai_jobs.init_app(app)
+    
+    from app.moderation import moderation
+    moderation.init_app(app)
+    
+    @app.before_request
+    def record_activity():
+        if current_user.is_authenticated:
+            activity.touch(current_user.id)
+    
     # Import socket events after app is created
     with app.app_context():
-        from app import call_events
+        from app import call_events, message_events
     
     return app
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app.identity_cache import identity_cache
+    return identity_cache.load(int(user_id))
@@ -0,0 +1,97 @@
+"""
+Write-behind activity tracking
+Requests and socket heartbeats record activity in memory; a background task
+writes the latest last_seen per user in one batched UPDATE every few seconds.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import socketio
+from app.models import db, User
+from app.presence import presence
+
+
+class ActivityTracker:
+    def __init__(self):
+        self.app = None
+        self._pending = {}  # user_id -> last activity not yet written
+        self._written = {}  # user_id -> last value written, to skip sub-resolution updates
+        self._lock = threading.Lock()
+        self._worker_started = False
+
+    def init_app(self, app):
+        self.app = app
+        app.jinja_env.globals['activity_status'] = self.status
+
+    def touch(self, user_id, at=None):
+        """Record activity for user_id; cheap enough to call on every request"""
+        at = at or datetime.utcnow()
+        resolution = timedelta(seconds=self.app.config['ACTIVITY_RESOLUTION'])
+        with self._lock:
+            written = self._written.get(user_id)
+            if written is not None and at - written < resolution:
+                return
+            self._pending[user_id] = at
+            start = not self._worker_started
+            self._worker_started = True
+        if start:
+            socketio.start_background_task(self._worker)
+
+    def last_seen(self, user):
+        """Newest known activity time, including writes still pending"""
+        pending = self._pending.get(user.id)
+        if pending and (user.last_seen is None or pending > user.last_seen):
+            return pending
+        return user.last_seen
+
+    def status(self, user):
+        """'online', 'recent' or None, honouring the user's show_online_status setting"""
+        if user.profile and not user.profile.show_online_status:
+            return None
+        if presence.is_online(user.id):
+            return 'online'
+        last_seen = self.last_seen(user)
+        window = timedelta(seconds=self.app.config['ACTIVITY_RECENT_WINDOW'])
+        if last_seen and datetime.utcnow() - last_seen < window:
+            return 'recent'
+        return None
+
+    def flush(self):
+        """Write every pending last_seen in one executemany UPDATE"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            db.session.execute(update(User), [
+                {'id': user_id, 'last_seen': at} for user_id, at in pending.items()
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                # Retry next pass unless newer activity arrived meanwhile
+                for user_id, at in pending.items():
+                    self._pending.setdefault(user_id, at)
+            raise
+        # Entries older than the resolution no longer suppress anything
+        horizon = datetime.utcnow() - timedelta(seconds=self.app.config['ACTIVITY_RESOLUTION'])
+        with self._lock:
+            self._written.update(pending)
+            self._written = {user_id: at for user_id, at in self._written.items() if at >= horizon}
+        return len(pending)
+
+    def _worker(self):
+        while True:
+            socketio.sleep(self.app.config['ACTIVITY_FLUSH_INTERVAL'])
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception as e:
+                    self.app.logger.error(f"last_seen flush failed: {str(e)}")
+
+
+# Global instance
+activity = ActivityTracker()
@@ -0,0 +1,162 @@
+"""
+AI result cache
+One cache for every generated AI artifact. Entries are keyed by a hash of the
+feature, the model, the generation parameters and a fingerprint of just the
+profile fields that feature's prompt reads, for each user involved. Pair
+features fingerprint the users lower id first, so both sides of a match share
+one entry and each profile keeps its place in the prompt.
+Editing an unrelated field (or nothing at all) keeps the key, so the LLM is
+only called again when a prompt input actually changes.
+
+A per-worker LRU sits in front of the ai_result_cache table. Concurrent misses
+on one key share a single generation, and canned fallback answers are never
+stored, so an upstream outage isn't cached.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, AIResultCacheEntry
+from app.groq_service import groq_service
+
+# Fields each feature's prompt reads from a user and their profile
+FEATURE_FIELDS = {
+    'conversation_starters': ('username', 'interests', 'languages', 'bio', 'current_role',
+                              'learning_goals', 'can_teach'),
+    'compatibility': ('interests', 'languages', 'current_role', 'experience_level',
+                      'learning_goals', 'can_teach', 'looking_for'),
+    'date_ideas': ('interests', 'city', 'collaboration_interest', 'can_teach'),
+    'profile_insights': ('bio', 'current_role', 'experience_level', 'interests', 'languages'),
+}
+
+USER_FIELDS = {'username', 'city', 'looking_for'}
+
+
+def _normalize(value):
+    if value is None:
+        return ''
+    return ' '.join(str(value).split())
+
+
+def profile_fingerprint(user, fields):
+    """Normalized values of the given fields, in field order"""
+    values = []
+    for field in fields:
+        if field == 'interests':
+            values.append(sorted(i.name for i in user.interests))
+        elif field == 'languages':
+            values.append(sorted(l.name for l in user.languages))
+        elif field in USER_FIELDS:
+            values.append(_normalize(getattr(user, field)))
+        else:
+            values.append(_normalize(getattr(user.profile, field) if user.profile else None))
+    return values
+
+
+class AIResultCache:
+    def __init__(self):
+        self.app = None
+        self._entries = OrderedDict()  # key -> result
+        self._stats = defaultdict(lambda: {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'fallbacks': 0})
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+
+    def key(self, feature, users, params=None, symmetric=False):
+        if symmetric:
+            # Ordered by id, not by value: swapping one field between the two
+            # profiles changes the prompt, so it must change the key too
+            users = sorted(users, key=lambda u: u.id)
+        prints = [profile_fingerprint(user, FEATURE_FIELDS[feature]) for user in users]
+        raw = json.dumps([feature, self.app.config['GROQ_MODEL'], params or {}, prints],
+                         sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get_or_create(self, feature, users, generate, params=None, symmetric=False):
+        """Cached result for feature and users, calling generate() only on a miss"""
+        key = self.key(feature, users, params, symmetric)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats[feature]['memory_hits'] += 1
+                return self._entries[key]
+
+        entry = db.session.get(AIResultCacheEntry, key)
+        if entry is not None:
+            result = json.loads(entry.result)
+            self._remember(key, result)
+            with self._lock:
+                self._stats[feature]['db_hits'] += 1
+            return result
+
+        # Both users of a pair, or repeated clicks, wait for one generation
+        result, used_fallback = groq_service.flights.do(
+            ('ai_cache', key), self._generate, feature, key, generate
+        )
+        if used_fallback:
+            # Waiters never ran generate() themselves, so flag it for the caller's call_tracked
+            groq_service.mark_fallback()
+        return result
+
+    def _generate(self, feature, key, generate):
+        """(result, whether it is a canned fallback); only real results are stored"""
+        result, used_fallback = groq_service.call_tracked(generate)
+        with self._lock:
+            self._stats[feature]['misses'] += 1
+            if used_fallback:
+                self._stats[feature]['fallbacks'] += 1
+        if result is None or used_fallback:
+            return result, used_fallback
+
+        self._remember(key, result)
+        db.session.add(AIResultCacheEntry(key=key, feature=feature, result=json.dumps(result)))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker stored the same key first
+            db.session.rollback()
+        return result, False
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.app.config['AI_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters per feature since the worker started"""
+        with self._lock:
+            features = {feature: dict(counts) for feature, counts in self._stats.items()}
+            size = len(self._entries)
+        for counts in features.values():
+            lookups = counts['memory_hits'] + counts['db_hits'] + counts['misses']
+            counts['hit_rate'] = round((counts['memory_hits'] + counts['db_hits']) / lookups, 3) if lookups else None
+        return {'memory_entries': size, 'features': features}
+
+
+# Global instance
+ai_cache = AIResultCache()
+
+
+def cached_conversation_starters(user, match_user):
+    """Starters for user to open with match_user"""
+    return ai_cache.get_or_create(
+        'conversation_starters', [user, match_user],
+        lambda: groq_service.generate_conversation_starters(user.profile, match_user.profile)
+    )
+
+
+def cached_compatibility(user, match_user):
+    """Compatibility analysis for a pair, shared by both sides"""
+    # Same prompt whichever side asks, lower user id first
+    user1, user2 = sorted([user, match_user], key=lambda u: u.id)
+    return ai_cache.get_or_create(
+        'compatibility', [user1, user2],
+        lambda: groq_service.analyze_compatibility(user1.profile, user2.profile),
+        symmetric=True
+    )
@@ -0,0 +1,171 @@
+"""
+Background AI jobs
+A new match queues conversation starters for both sides and the pair's
+compatibility analysis in the ai_jobs table, so the first click on either
+finds a warm ai_cache entry instead of waiting on Groq. Jobs live in the
+database: they survive restarts, and any worker may run them. Each worker
+claims at most AI_JOB_CONCURRENCY jobs at a time, highest priority first,
+leaving the rest of the Groq pool to interactive requests.
+
+Claims are compare-and-set on the attempt count, so two workers never take
+the same job. A job whose worker died is reclaimed once its lease runs out;
+failures are retried with backoff up to AI_JOB_MAX_ATTEMPTS.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from app import socketio
+from app.models import db, User, AIJob
+from app.ai_cache import cached_conversation_starters, cached_compatibility
+from app.groq_service import groq_service
+from app.social_graph import social_graph
+
+JOB_TYPES = {
+    'conversation_starters': cached_conversation_starters,
+    'compatibility': cached_compatibility,
+}
+
+# The user who completed the match is looking at it right now
+PRIORITY_ACTIVE = 2
+PRIORITY_PAIR = 1
+PRIORITY_OTHER = 0
+
+
+class AIJobQueue:
+    def __init__(self):
+        self.app = None
+        self._running = 0
+        self._lock = threading.Lock()
+        self._worker_started = False
+
+    def init_app(self, app):
+        self.app = app
+        # Jobs queued before a restart resume once this worker serves a request
+        app.before_request(self.start)
+
+    def start(self):
+        if self._worker_started:
+            return
+        with self._lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+        socketio.start_background_task(self._worker)
+
+    def enqueue_match(self, user_id, other_id):
+        """Queue warm-up work for a new match; call after the match is committed"""
+        db.session.add_all([
+            AIJob(kind='conversation_starters', user_id=user_id, other_id=other_id, priority=PRIORITY_ACTIVE),
+            AIJob(kind='compatibility', user_id=min(user_id, other_id), other_id=max(user_id, other_id),
+                  priority=PRIORITY_PAIR),
+            AIJob(kind='conversation_starters', user_id=other_id, other_id=user_id, priority=PRIORITY_OTHER),
+        ])
+        try:
+            db.session.commit()
+        except Exception as e:
+            # Only a warm-up: the endpoints still generate on demand
+            db.session.rollback()
+            self.app.logger.error(f"AI job enqueue failed: {str(e)}")
+            return
+        self.start()
+
+    def claim(self, limit):
+        """Mark up to limit due jobs as running on this worker and return their ids"""
+        now = datetime.utcnow()
+        lost = now - timedelta(seconds=self.app.config['AI_JOB_LEASE'])
+        candidates = db.session.execute(
+            select(AIJob.id, AIJob.attempts)
+            .where(or_(
+                and_(AIJob.status == 'pending', AIJob.run_after <= now),
+                and_(AIJob.status == 'running', AIJob.claimed_at < lost),
+            ))
+            .order_by(AIJob.priority.desc(), AIJob.id)
+            .limit(limit)
+        ).all()
+
+        claimed = []
+        for job_id, attempts in candidates:
+            # Another worker that claimed it first has already bumped attempts
+            result = db.session.execute(
+                update(AIJob)
+                .where(AIJob.id == job_id, AIJob.attempts == attempts)
+                .values(status='running', claimed_at=now, attempts=attempts + 1)
+            )
+            if result.rowcount:
+                claimed.append(job_id)
+        db.session.commit()
+        return claimed
+
+    def run(self, job_id):
+        """Run one claimed job, then delete it or schedule a retry"""
+        job = db.session.get(AIJob, job_id)
+        if job is None:
+            return
+        try:
+            self._execute(job)
+        except Exception as e:
+            db.session.rollback()
+            self._retry_or_fail(job, e)
+            return
+        db.session.delete(job)
+        db.session.commit()
+
+    @staticmethod
+    def _execute(job):
+        user = db.session.get(User, job.user_id)
+        other = db.session.get(User, job.other_id)
+        # Unmatched, blocked or deactivated since: nothing worth warming
+        if user is None or other is None or not (user.is_active and other.is_active):
+            return
+        if not social_graph.has_matched(user.id, other.id):
+            return
+        result, used_fallback = groq_service.call_tracked(JOB_TYPES[job.kind], user, other)
+        if result is None or used_fallback:
+            raise RuntimeError('Groq unavailable, got no result to cache')
+
+    def _retry_or_fail(self, job, error):
+        job.error = str(error)
+        if job.attempts >= self.app.config['AI_JOB_MAX_ATTEMPTS']:
+            job.status = 'failed'
+            self.app.logger.error(f"AI job {job.id} ({job.kind}) failed: {str(error)}")
+        else:
+            delay = self.app.config['AI_JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1)
+            job.status = 'pending'
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+
+    def _run_task(self, job_id):
+        try:
+            with self.app.app_context():
+                try:
+                    self.run(job_id)
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"AI job {job_id} crashed: {str(e)}")
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                free = self.app.config['AI_JOB_CONCURRENCY'] - self._running
+            if free > 0:
+                job_ids = []
+                with self.app.app_context():
+                    try:
+                        job_ids = self.claim(free)
+                    except Exception as e:
+                        db.session.rollback()
+                        self.app.logger.error(f"AI job claim failed: {str(e)}")
+                for job_id in job_ids:
+                    with self._lock:
+                        self._running += 1
+                    socketio.start_background_task(self._run_task, job_id)
+            socketio.sleep(self.app.config['AI_JOB_POLL_INTERVAL'])
+
+
+# Global instance
+ai_jobs = AIJobQueue()
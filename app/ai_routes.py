@@ -2,16 +2,48 @@
 AI Features Blueprint
 Handles all AI-powered endpoints using Groq
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_login import login_required, current_user
-from app.models import db, User, CompatibilityAnalysis, AIConversationStarter, DateIdea, ProfileInsight
+from app.models import User
 from app.groq_service import groq_service
+from app.ai_cache import ai_cache, cached_conversation_starters, cached_compatibility
+from app.social_graph import social_graph
+from app.moderation import moderation
 import json
-from sqlalchemy import or_, and_
 
 ai_bp = Blueprint('ai', __name__, url_prefix='/ai')
 
 
+def _wants_stream():
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def _count_range(count):
+    """Power-of-two bucket a count falls in, as shown to the model: 0, 1, 2-3, 4-7, ..."""
+    if count < 2:
+        return str(count)
+    low = 1 << (count.bit_length() - 1)
+    return f'{low}-{2 * low - 1}'
+
+
+def _event_stream(chunks):
+    """Relay text chunks as Server-Sent Events: token*, then done or error"""
+    def events():
+        try:
+            for text in chunks:
+                yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            current_app.logger.error(f"AI stream failed: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            # Runs on client disconnect too, closing the upstream stream
+            chunks.close()
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @ai_bp.route('/conversation-starters/<int:match_id>')
 @login_required
 def conversation_starters(match_id):
@@ -23,29 +55,7 @@ def conversation_starters(match_id):
         return jsonify({'error': 'You must match with this user first'}), 403
     
     try:
-        # Check if we have recent starters cached
-        cached = AIConversationStarter.query.filter_by(
-            user_id=current_user.id,
-            match_id=match_id
-        ).order_by(AIConversationStarter.created_at.desc()).first()
-        
-        if cached and (datetime.utcnow() - cached.created_at).days < 7:
-            starters = json.loads(cached.starters)
-        else:
-            # Generate new starters
-            starters = groq_service.generate_conversation_starters(
-                current_user.profile,
-                match_user.profile
-            )
-            
-            # Cache them
-            new_starters = AIConversationStarter(
-                user_id=current_user.id,
-                match_id=match_id,
-                starters=json.dumps(starters)
-            )
-            db.session.add(new_starters)
-            db.session.commit()
+        starters = cached_conversation_starters(current_user, match_user)
         
         return jsonify({'success': True, 'starters': starters})
     
@@ -69,6 +79,9 @@ def enhance_bio():
         'can_teach': current_user.profile.can_teach if current_user.profile else None
     }
     
+    if _wants_stream():
+        return _event_stream(groq_service.enhance_bio_stream(current_bio, user_data))
+    
     try:
         suggestions = groq_service.enhance_bio(current_bio, user_data)
         return jsonify({'success': True, 'suggestions': suggestions})
@@ -87,42 +100,7 @@ def compatibility_analysis(match_id):
         return jsonify({'error': 'You must match with this user first'}), 403
     
     try:
-        # Check cache
-        cached = CompatibilityAnalysis.query.filter(
-            or_(
-                and_(CompatibilityAnalysis.user1_id == current_user.id, CompatibilityAnalysis.user2_id == match_id),
-                and_(CompatibilityAnalysis.user1_id == match_id, CompatibilityAnalysis.user2_id == current_user.id)
-            )
-        ).order_by(CompatibilityAnalysis.created_at.desc()).first()
-        
-        if cached and (datetime.utcnow() - cached.created_at).days < 30:
-            result = {
-                'compatibility_score': cached.compatibility_score,
-                'strengths': json.loads(cached.strengths) if cached.strengths else [],
-                'learning_opportunities': cached.learning_opportunities,
-                'conversation_topics': json.loads(cached.conversation_topics) if cached.conversation_topics else [],
-                'overall_summary': cached.overall_summary
-            }
-        else:
-            # Generate new analysis
-            result = groq_service.analyze_compatibility(
-                current_user.profile,
-                match_user.profile
-            )
-            
-            if result:
-                # Cache it
-                analysis = CompatibilityAnalysis(
-                    user1_id=current_user.id,
-                    user2_id=match_id,
-                    compatibility_score=result.get('compatibility_score'),
-                    strengths=json.dumps(result.get('strengths', [])),
-                    learning_opportunities=result.get('learning_opportunities'),
-                    conversation_topics=json.dumps(result.get('conversation_topics', [])),
-                    overall_summary=result.get('overall_summary')
-                )
-                db.session.add(analysis)
-                db.session.commit()
+        result = cached_compatibility(current_user, match_user)
         
         return jsonify({'success': True, 'analysis': result})
     
@@ -141,31 +119,12 @@ def date_ideas(match_id):
         return jsonify({'error': 'You must match with this user first'}), 403
     
     try:
-        # Check cache
-        cached = DateIdea.query.filter(
-            or_(
-                and_(DateIdea.user1_id == current_user.id, DateIdea.user2_id == match_id),
-                and_(DateIdea.user1_id == match_id, DateIdea.user2_id == current_user.id)
-            )
-        ).order_by(DateIdea.created_at.desc()).first()
-        
-        if cached and (datetime.utcnow() - cached.created_at).days < 14:
-            ideas = json.loads(cached.ideas)
-        else:
-            # Generate new ideas
-            ideas = groq_service.generate_date_ideas(
-                current_user.profile,
-                match_user.profile
-            )
-            
-            # Cache them
-            new_ideas = DateIdea(
-                user1_id=current_user.id,
-                user2_id=match_id,
-                ideas=json.dumps(ideas)
-            )
-            db.session.add(new_ideas)
-            db.session.commit()
+        user1, user2 = sorted([current_user, match_user], key=lambda u: u.id)
+        ideas = ai_cache.get_or_create(
+            'date_ideas', [user1, user2],
+            lambda: groq_service.generate_date_ideas(user1.profile, user2.profile),
+            symmetric=True
+        )
         
         return jsonify({'success': True, 'ideas': ideas})
     
@@ -184,6 +143,9 @@ def message_coach():
     if not message or len(message) < 5:
         return jsonify({'success': False, 'error': 'Message too short'}), 400
     
+    if _wants_stream():
+        return _event_stream(groq_service.coach_message_stream(message, context))
+    
     try:
         coaching = groq_service.coach_message(message, context)
         return jsonify({'success': True, 'coaching': coaching})
@@ -201,10 +163,7 @@ def profile_insights():
         likes_received = current_user.received_likes.count()
         
         # Count matches
-        matches = 0
-        for like in current_user.sent_likes:
-            if like.liked.has_liked(current_user):
-                matches += 1
+        matches = len(social_graph.match_ids(current_user.id))
         
         # Profile completeness
         completeness = 0
@@ -230,28 +189,16 @@ def profile_insights():
             'response_rate': 0  # Would need message tracking
         }
         
-        # Check cache
-        cached = ProfileInsight.query.filter_by(
-            user_id=current_user.id
-        ).order_by(ProfileInsight.created_at.desc()).first()
-        
-        if cached and (datetime.utcnow() - cached.created_at).days < 7:
-            insights = cached.insights
-        else:
-            # Generate new insights
-            insights = groq_service.generate_profile_insights(
-                current_user.profile if current_user.profile else None,
-                stats
-            )
-            
-            # Cache them
-            new_insight = ProfileInsight(
-                user_id=current_user.id,
-                insights=insights,
-                profile_score=stats['completeness']
-            )
-            db.session.add(new_insight)
-            db.session.commit()
+        # The prompt sees activity counts as ranges and the key covers exactly what
+        # it sees, so the cached text only changes when a count crosses a power of two
+        prompt_stats = dict(stats)
+        for k in ('likes_sent', 'likes_received', 'matches'):
+            prompt_stats[k] = _count_range(stats[k])
+        insights = ai_cache.get_or_create(
+            'profile_insights', [current_user],
+            lambda: groq_service.generate_profile_insights(current_user.profile, prompt_stats),
+            params={'stats': prompt_stats}
+        )
         
         return jsonify({
             'success': True,
@@ -276,10 +223,9 @@ def moderate():
         return jsonify({'success': False, 'error': 'No content provided'}), 400
     
     try:
-        result = groq_service.moderate_content(content, content_type)
+        # Clean content is settled locally; flagged content waits for its batch
+        result = moderation.moderate(content_type, current_user.id, content)
         return jsonify({'success': True, 'moderation': result})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-
-from datetime import datetime
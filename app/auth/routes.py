@@ -3,6 +3,8 @@ from flask_login import login_user, logout_user, current_user
 from app import db
 from app.models import User, Profile
 from app.forms import RegistrationForm, LoginForm, ProfileSetupForm
+from app.search_index import search_index
+from app.identity_cache import identity_cache
 from datetime import datetime
 from app.auth import auth
 
@@ -32,6 +34,7 @@ def register():
         # Create empty profile
         profile = Profile(user_id=user.id)
         db.session.add(profile)
+        search_index.index_user(user)
         db.session.commit()
         
         flash('Registration successful! Please complete your profile.', 'success')
@@ -118,7 +121,9 @@ def setup_profile():
             file.save(file_path)
             profile.profile_photo = filename
         
+        search_index.index_user(current_user)
         db.session.commit()
+        identity_cache.invalidate(current_user.id)
         flash('Profile setup complete! Start discovering tech buddies.', 'success')
         return redirect(url_for('main.discover'))
     
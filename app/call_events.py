@@ -1,151 +1,199 @@
-from flask import request, session
-from flask_socketio import emit
+from flask import request
+from flask_socketio import emit, join_room
 from flask_login import current_user
 from app import socketio
-
-# Store user socket IDs
-user_sockets = {}
+from app.message_events import user_room
+from app.presence import presence
+from app.activity import activity
+from app.socket_identity import remember_identity, socket_identity, forget_identity
+from app.signaling import ice_batcher
+from app.calls import call_registry
+from app.event_log import signal_log
 
 @socketio.on('connect')
 def handle_connect():
-    print(f'Socket connection attempt - Session: {session}')
     if current_user.is_authenticated:
-        user_sockets[current_user.id] = request.sid
-        print(f'✅ User {current_user.id} ({current_user.username}) connected with socket {request.sid}')
-        print(f'Active sockets: {user_sockets}')
+        remember_identity(current_user)
+        join_room(user_room(current_user.id))
+        came_online = presence.connect(current_user.id, request.sid)
+        activity.touch(current_user.id)
+        signal_log.info('connect', user_id=current_user.id, sid=request.sid, came_online=came_online)
     else:
-        print('⚠️ Unauthenticated connection attempt')
+        signal_log.warning('connect_rejected', sid=request.sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    if current_user.is_authenticated:
-        if current_user.id in user_sockets:
-            del user_sockets[current_user.id]
-        print(f'❌ User {current_user.id} disconnected')
-        print(f'Active sockets: {user_sockets}')
+    identity = forget_identity()
+    if identity is not None:
+        went_offline = presence.disconnect(identity.id, request.sid)
+        activity.touch(identity.id)
+        if went_offline:
+            # Last tab closed: nobody is left to hang up their calls
+            call_registry.hang_up_all(identity.id)
+        signal_log.info('disconnect', user_id=identity.id, sid=request.sid, went_offline=went_offline)
+
+@socketio.on('heartbeat')
+def handle_heartbeat():
+    """Keep this socket's presence entry alive"""
+    identity = socket_identity()
+    if identity is not None:
+        presence.heartbeat(identity.id, request.sid)
+        activity.touch(identity.id)
+        call_registry.renew(identity.id)
+        signal_log.debug('heartbeat', user_id=identity.id, sid=request.sid)
 
 @socketio.on('initiate_call')
 def handle_initiate_call(data):
     """Handle call initiation from one user to another"""
-    print('\n📞 INITIATE CALL Event received:')
-    print(f'   Data: {data}')
-    print(f'   Authenticated: {current_user.is_authenticated}')
-    
-    if not current_user.is_authenticated:
-        print('   ❌ User not authenticated')
+    identity = socket_identity()
+    if identity is None:
+        signal_log.warning('initiate_call_unauthenticated', sid=request.sid)
         return
     
     receiver_id = data.get('receiver_id')
     call_type = data.get('call_type')  # 'voice' or 'video'
     
-    print(f'   Caller: User {current_user.id} ({current_user.username})')
-    print(f'   Receiver: User {receiver_id}')
-    print(f'   Call Type: {call_type}')
-    print(f'   Active sockets: {user_sockets}')
-    print(f'   Receiver in sockets: {receiver_id in user_sockets}')
-    
-    if receiver_id in user_sockets:
-        receiver_socket = user_sockets[receiver_id]
-        print(f'   ✅ Sending incoming_call to socket {receiver_socket}')
-        
-        emit('incoming_call', {
-            'caller_id': current_user.id,
-            'caller_username': current_user.username,
-            'caller_photo': current_user.profile.profile_photo if current_user.profile else None,
-            'call_type': call_type
-        }, room=receiver_socket)
-        
-        print(f'   ✅ Call notification sent to User {receiver_id}')
-    else:
-        print('   ❌ Receiver not connected (not in sockets dict)')
+    if not receiver_id or call_type not in ('voice', 'video'):
+        signal_log.warning('initiate_call_invalid', caller_id=identity.id,
+                           receiver_id=receiver_id, call_type=call_type)
+        return
+    
+    if call_registry.start(identity.id, receiver_id, call_type) is None:
+        # One live call per pair: a second tab or both sides dialling at once
+        emit('call_busy', {'receiver_id': receiver_id})
+        signal_log.info('call_busy', caller_id=identity.id, receiver_id=receiver_id)
+        return
+    
+    # Per-user room: reaches every socket of the receiver on any worker
+    emit('incoming_call', {
+        'caller_id': identity.id,
+        'caller_username': identity.username,
+        'caller_photo': identity.photo,
+        'call_type': call_type
+    }, room=user_room(receiver_id))
+    
+    signal_log.info('initiate_call', caller_id=identity.id, receiver_id=receiver_id, call_type=call_type)
 
 @socketio.on('accept_call')
 def handle_accept_call(data):
     """Handle call acceptance"""
-    if not current_user.is_authenticated:
+    identity = socket_identity()
+    if identity is None:
         return
     
     caller_id = data.get('caller_id')
+    if not caller_id or call_registry.accept(identity.id, caller_id) is None:
+        # Rang out, cancelled or answered on another tab before this arrived
+        emit('call_ended', {'ended_by': None, 'duration': None})
+        signal_log.info('accept_call_stale', callee_id=identity.id, caller_id=caller_id)
+        return
+    
+    emit('call_accepted', {
+        'accepter_id': identity.id,
+        'accepter_username': identity.username
+    }, room=user_room(caller_id))
     
-    if caller_id in user_sockets:
-        emit('call_accepted', {
-            'accepter_id': current_user.id,
-            'accepter_username': current_user.username
-        }, room=user_sockets[caller_id])
-        
-        print(f'Call accepted by {current_user.id} from {caller_id}')
+    signal_log.info('accept_call', callee_id=identity.id, caller_id=caller_id)
 
 @socketio.on('reject_call')
 def handle_reject_call(data):
     """Handle call rejection"""
-    if not current_user.is_authenticated:
+    identity = socket_identity()
+    if identity is None:
         return
     
     caller_id = data.get('caller_id')
+    if not caller_id:
+        return
+    call_registry.reject(identity.id, caller_id)
     
-    if caller_id in user_sockets:
-        emit('call_rejected', {
-            'rejecter_id': current_user.id
-        }, room=user_sockets[caller_id])
-        
-        print(f'Call rejected by {current_user.id} from {caller_id}')
+    emit('call_rejected', {
+        'rejecter_id': identity.id
+    }, room=user_room(caller_id))
+    
+    signal_log.info('reject_call', callee_id=identity.id, caller_id=caller_id)
 
 @socketio.on('end_call')
 def handle_end_call(data):
     """Handle call end"""
-    if not current_user.is_authenticated:
+    identity = socket_identity()
+    if identity is None:
         return
     
     other_user_id = data.get('other_user_id')
+    if not other_user_id:
+        return
+    call = call_registry.end(identity.id, other_user_id)
     
-    if other_user_id in user_sockets:
-        emit('call_ended', {
-            'ended_by': current_user.id
-        }, room=user_sockets[other_user_id])
-        
-        print(f'Call ended by {current_user.id}')
+    emit('call_ended', {
+        'ended_by': identity.id,
+        'duration': call.duration if call else None
+    }, room=user_room(other_user_id))
+    
+    signal_log.info('end_call', user_id=identity.id, other_user_id=other_user_id,
+                    outcome=call.outcome if call else None, duration=call.duration if call else None)
 
 @socketio.on('webrtc_offer')
 def handle_webrtc_offer(data):
     """Forward WebRTC offer to the other peer"""
-    if not current_user.is_authenticated:
+    identity = socket_identity()
+    if identity is None:
         return
     
     receiver_id = data.get('receiver_id')
     offer = data.get('offer')
     
-    if receiver_id in user_sockets:
-        emit('webrtc_offer', {
-            'sender_id': current_user.id,
-            'offer': offer
-        }, room=user_sockets[receiver_id])
+    emit('webrtc_offer', {
+        'sender_id': identity.id,
+        'offer': offer
+    }, room=user_room(receiver_id))
+    signal_log.debug('webrtc_offer', sender_id=identity.id, receiver_id=receiver_id)
 
 @socketio.on('webrtc_answer')
 def handle_webrtc_answer(data):
     """Forward WebRTC answer to the other peer"""
-    if not current_user.is_authenticated:
+    identity = socket_identity()
+    if identity is None:
         return
     
     receiver_id = data.get('receiver_id')
     answer = data.get('answer')
     
-    if receiver_id in user_sockets:
-        emit('webrtc_answer', {
-            'sender_id': current_user.id,
-            'answer': answer
-        }, room=user_sockets[receiver_id])
+    emit('webrtc_answer', {
+        'sender_id': identity.id,
+        'answer': answer
+    }, room=user_room(receiver_id))
+    signal_log.debug('webrtc_answer', sender_id=identity.id, receiver_id=receiver_id)
 
 @socketio.on('webrtc_ice_candidate')
 def handle_ice_candidate(data):
     """Forward ICE candidate to the other peer"""
-    if not current_user.is_authenticated:
+    identity = socket_identity()
+    if identity is None:
         return
     
     receiver_id = data.get('receiver_id')
     candidate = data.get('candidate')
     
-    if receiver_id in user_sockets:
-        emit('webrtc_ice_candidate', {
-            'sender_id': current_user.id,
-            'candidate': candidate
-        }, room=user_sockets[receiver_id])
+    emit('webrtc_ice_candidate', {
+        'sender_id': identity.id,
+        'candidate': candidate
+    }, room=user_room(receiver_id))
+    signal_log.debug('webrtc_ice_candidate', sender_id=identity.id, receiver_id=receiver_id)
+
+@socketio.on('webrtc_ice_candidates')
+def handle_ice_candidates(data):
+    """Buffer a batch of ICE candidates; the pair's buffer is relayed as one frame"""
+    identity = socket_identity()
+    if identity is None:
+        return
+    
+    receiver_id = data.get('receiver_id')
+    candidates = data.get('candidates') or []
+    ice_batcher.add(identity.id, receiver_id, candidates)
+    signal_log.debug('webrtc_ice_candidates', sender_id=identity.id, receiver_id=receiver_id,
+                     count=len(candidates), complete=bool(data.get('complete')))
+    
+    # Gathering finished: don't make the last candidates wait out the window
+    if data.get('complete'):
+        ice_batcher.flush(identity.id, receiver_id)
@@ -0,0 +1,413 @@
+"""
+Call session registry
+Tracks every call, keyed by the (lower id, higher id) pair, through
+ringing -> active -> ended. A pair has at most one live call. Ringing calls
+expire after CALL_RING_TIMEOUT; active calls hold a CALL_LEASE that the
+participants' heartbeats renew, and a user's calls end when their last socket
+goes away. Finished calls are written to the conversation as 'call' messages
+in one batched INSERT.
+
+With several workers the calls live in Redis (CALL_REDIS_URL), so an accept
+or hang-up handled by one worker is seen by the worker that placed the call.
+Every transition is one atomic script, so exactly one worker ends and records
+each call. The local store covers a single process.
+"""
+import heapq
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import socketio
+from app.models import db, Message, UnreadCounter, ConversationSummary
+from app.message_events import user_room
+from app.presence import presence
+
+RINGING, ACTIVE, ENDED = 'ringing', 'active', 'ended'
+
+
+class CallSession:
+    """One call; slotted so thousands of live calls stay a few hundred bytes each"""
+    __slots__ = ('caller_id', 'callee_id', 'call_type', 'state', 'outcome',
+                 'started_at', 'answered_at', 'ended_at')
+
+    def __init__(self, caller_id, callee_id, call_type):
+        self.caller_id = caller_id
+        self.callee_id = callee_id
+        self.call_type = call_type
+        self.state = RINGING
+        self.outcome = None
+        self.started_at = datetime.utcnow()
+        self.answered_at = None
+        self.ended_at = None
+
+    @classmethod
+    def from_fields(cls, fields):
+        """Rebuild a session from its Redis hash"""
+        session = cls(int(fields['caller_id']), int(fields['callee_id']), fields['call_type'])
+        session.state = fields['state']
+        session.started_at = datetime.fromisoformat(fields['started_at'])
+        if fields.get('answered_at'):
+            session.answered_at = datetime.fromisoformat(fields['answered_at'])
+        return session
+
+    @property
+    def duration(self):
+        """Whole seconds between answer and hang-up; None for unanswered calls"""
+        if self.answered_at is None or self.ended_at is None:
+            return None
+        return int((self.ended_at - self.answered_at).total_seconds())
+
+    def record(self):
+        """Row for the batched messages INSERT"""
+        label = f'{self.call_type} call' if self.outcome == 'completed' else f'{self.outcome} {self.call_type} call'
+        return {
+            'sender_id': self.caller_id,
+            'receiver_id': self.callee_id,
+            'content': label,
+            'message_type': 'call',
+            'duration': self.duration,
+            'sent_at': self.started_at,
+            # Only a missed call is news to the callee; the rest they took part in
+            'is_read': self.outcome != 'missed',
+            'is_deleted': False,
+        }
+
+
+class LocalCallStore:
+    """Calls for one process: {pair: CallSession} with a deadline each, behind a lock.
+
+    A pair's deadline is its ring timeout while ringing and its lease once active.
+    """
+
+    def __init__(self):
+        self._calls = {}  # (low_id, high_id) -> CallSession
+        self._by_user = {}  # user_id -> pairs with a live call
+        self._deadlines = {}  # pair -> current deadline
+        self._heap = []  # (deadline, pair); entries superseded by a renewal are skipped
+        self._lock = threading.Lock()
+
+    def _set_deadline(self, pair, deadline):
+        self._deadlines[pair] = deadline
+        heapq.heappush(self._heap, (deadline, pair))
+
+    def add(self, pair, session, deadline):
+        with self._lock:
+            if pair in self._calls:
+                return False
+            self._calls[pair] = session
+            for user_id in pair:
+                self._by_user.setdefault(user_id, set()).add(pair)
+            self._set_deadline(pair, deadline)
+            return True
+
+    def accept(self, pair, callee_id, answered_at, deadline):
+        with self._lock:
+            session = self._calls.get(pair)
+            if session is None or session.state != RINGING or session.callee_id != callee_id:
+                return None
+            session.state = ACTIVE
+            session.answered_at = answered_at
+            self._set_deadline(pair, deadline)
+            return session
+
+    def renew(self, pair, deadline):
+        with self._lock:
+            session = self._calls.get(pair)
+            if session is not None and session.state == ACTIVE:
+                self._set_deadline(pair, deadline)
+
+    def pop(self, pair, state=None, callee_id=None, due_by=None):
+        """Remove and return the pair's call if it matches every given condition"""
+        with self._lock:
+            session = self._calls.get(pair)
+            if session is None or (state and session.state != state):
+                return None
+            if callee_id is not None and session.callee_id != callee_id:
+                return None
+            if due_by is not None and self._deadlines[pair] > due_by:
+                return None
+            del self._calls[pair]
+            del self._deadlines[pair]
+            for user_id in pair:
+                pairs = self._by_user[user_id]
+                pairs.discard(pair)
+                if not pairs:
+                    del self._by_user[user_id]
+            return session
+
+    def due(self, now):
+        """Pairs whose deadline has passed"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, pair = heapq.heappop(self._heap)
+                if self._deadlines.get(pair) == deadline:
+                    due.append(pair)
+        return due
+
+    def pairs_of(self, user_id):
+        with self._lock:
+            return set(self._by_user.get(user_id, ()))
+
+
+class RedisCallStore:
+    """Calls shared by every worker: a hash per pair, a sorted set of deadlines
+    and a set of pairs per user, changed only through the scripts below."""
+
+    DEADLINES = 'call_deadlines'
+
+    _ADD = """
+    if redis.call('exists', KEYS[1]) == 1 then return 0 end
+    redis.call('hset', KEYS[1], 'caller_id', ARGV[2], 'callee_id', ARGV[3], 'call_type', ARGV[4],
+               'state', 'ringing', 'started_at', ARGV[5])
+    redis.call('zadd', KEYS[2], ARGV[6], ARGV[1])
+    redis.call('sadd', KEYS[3], ARGV[1])
+    redis.call('sadd', KEYS[4], ARGV[1])
+    return 1
+    """
+    _ACCEPT = """
+    if redis.call('hget', KEYS[1], 'state') ~= 'ringing' or redis.call('hget', KEYS[1], 'callee_id') ~= ARGV[2] then
+        return nil
+    end
+    redis.call('hset', KEYS[1], 'state', 'active', 'answered_at', ARGV[3])
+    redis.call('zadd', KEYS[2], ARGV[4], ARGV[1])
+    return redis.call('hgetall', KEYS[1])
+    """
+    _RENEW = """
+    if redis.call('hget', KEYS[1], 'state') == 'active' then
+        redis.call('zadd', KEYS[2], 'XX', ARGV[2], ARGV[1])
+    end
+    """
+    _POP = """
+    local state = redis.call('hget', KEYS[1], 'state')
+    if not state or (ARGV[2] ~= '' and state ~= ARGV[2]) then return nil end
+    if ARGV[3] ~= '' and redis.call('hget', KEYS[1], 'callee_id') ~= ARGV[3] then return nil end
+    if ARGV[4] ~= '' then
+        local deadline = redis.call('zscore', KEYS[2], ARGV[1])
+        if not deadline or tonumber(deadline) > tonumber(ARGV[4]) then return nil end
+    end
+    local fields = redis.call('hgetall', KEYS[1])
+    redis.call('del', KEYS[1])
+    redis.call('zrem', KEYS[2], ARGV[1])
+    redis.call('srem', KEYS[3], ARGV[1])
+    redis.call('srem', KEYS[4], ARGV[1])
+    return fields
+    """
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._add = self._redis.register_script(self._ADD)
+        self._accept = self._redis.register_script(self._ACCEPT)
+        self._renew = self._redis.register_script(self._RENEW)
+        self._pop = self._redis.register_script(self._POP)
+
+    @staticmethod
+    def _member(pair):
+        return f'{pair[0]}:{pair[1]}'
+
+    def _keys(self, pair):
+        member = self._member(pair)
+        return [f'call:{member}', self.DEADLINES, f'call_user:{pair[0]}', f'call_user:{pair[1]}']
+
+    @staticmethod
+    def _session(fields):
+        if not fields:
+            return None
+        return CallSession.from_fields(dict(zip(fields[::2], fields[1::2])))
+
+    def add(self, pair, session, deadline):
+        return bool(self._add(keys=self._keys(pair), args=[
+            self._member(pair), session.caller_id, session.callee_id, session.call_type,
+            session.started_at.isoformat(), deadline
+        ]))
+
+    def accept(self, pair, callee_id, answered_at, deadline):
+        return self._session(self._accept(keys=self._keys(pair)[:2], args=[
+            self._member(pair), callee_id, answered_at.isoformat(), deadline
+        ]))
+
+    def renew(self, pair, deadline):
+        self._renew(keys=self._keys(pair)[:2], args=[self._member(pair), deadline])
+
+    def pop(self, pair, state=None, callee_id=None, due_by=None):
+        return self._session(self._pop(keys=self._keys(pair), args=[
+            self._member(pair), state or '', '' if callee_id is None else callee_id,
+            '' if due_by is None else due_by
+        ]))
+
+    def due(self, now):
+        return [tuple(int(user_id) for user_id in member.split(':'))
+                for member in self._redis.zrangebyscore(self.DEADLINES, '-inf', now)]
+
+    def pairs_of(self, user_id):
+        return {tuple(int(i) for i in member.split(':'))
+                for member in self._redis.smembers(f'call_user:{user_id}')}
+
+
+class CallRegistry:
+    def __init__(self):
+        self.app = None
+        self.store = LocalCallStore()
+        self._finished = []  # ended sessions not yet written
+        self._lock = threading.Lock()
+        self._worker_started = False
+
+    def init_app(self, app):
+        self.app = app
+        url = app.config.get('CALL_REDIS_URL')
+        self.store = RedisCallStore(url) if url else LocalCallStore()
+        # Sockets that stop heartbeating never send a disconnect
+        presence.on_offline(self.hang_up_all)
+
+    @staticmethod
+    def pair(user_a_id, user_b_id):
+        user_a_id, user_b_id = int(user_a_id), int(user_b_id)
+        return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
+
+    def _lease_deadline(self):
+        return time.time() + self.app.config['CALL_LEASE']
+
+    def start(self, caller_id, callee_id, call_type):
+        """Open a ringing call; None when the pair already has one ringing or active"""
+        session = CallSession(int(caller_id), int(callee_id), call_type)
+        deadline = time.time() + self.app.config['CALL_RING_TIMEOUT']
+        if not self.store.add(self.pair(caller_id, callee_id), session, deadline):
+            return None
+        self._start_worker()
+        return session
+
+    def accept(self, callee_id, caller_id):
+        """Move the pair's ringing call to active; None unless callee_id is being called"""
+        session = self.store.accept(self.pair(caller_id, callee_id), int(callee_id),
+                                    datetime.utcnow(), self._lease_deadline())
+        if session is not None:
+            self._start_worker()
+        return session
+
+    def renew(self, user_id):
+        """Extend the lease on user_id's active calls; called on every heartbeat"""
+        for pair in self.store.pairs_of(user_id):
+            self.store.renew(pair, self._lease_deadline())
+
+    def reject(self, callee_id, caller_id):
+        """Decline a ringing call"""
+        session = self.store.pop(self.pair(caller_id, callee_id), state=RINGING, callee_id=int(callee_id))
+        return self._finish(session, 'declined') if session else None
+
+    def end(self, user_id, other_id):
+        """Hang up: completes an active call, cancels one still ringing"""
+        session = self.store.pop(self.pair(user_id, other_id))
+        if session is None:
+            return None
+        return self._finish(session, 'completed' if session.state == ACTIVE else 'cancelled')
+
+    def hang_up_all(self, user_id):
+        """End every call of a user who went offline and tell the other side"""
+        ended = []
+        for pair in self.store.pairs_of(user_id):
+            session = self.store.pop(pair)
+            if session is None:
+                continue
+            if session.state == ACTIVE:
+                outcome = 'completed'
+            else:
+                outcome = 'cancelled' if session.caller_id == user_id else 'missed'
+            ended.append(self._finish(session, outcome))
+            other_id = session.callee_id if session.caller_id == user_id else session.caller_id
+            socketio.emit('call_ended', {'ended_by': user_id, 'duration': session.duration},
+                          to=user_room(other_id))
+        return ended
+
+    def expire(self):
+        """End calls that rang out or whose lease lapsed; returns them so both sides can be told"""
+        now = time.time()
+        expired = []
+        for pair in self.store.due(now):
+            # Another worker may have answered, ended or renewed it since due() looked
+            session = self.store.pop(pair, due_by=now)
+            if session is not None:
+                expired.append(self._finish(session, 'missed' if session.state == RINGING else 'completed'))
+        return expired
+
+    def _finish(self, session, outcome):
+        """Mark ended and queue for the next write"""
+        session.state = ENDED
+        session.outcome = outcome
+        session.ended_at = datetime.utcnow()
+        with self._lock:
+            self._finished.append(session)
+        return session
+
+    def flush(self):
+        """Write finished calls as 'call' messages in one executemany INSERT"""
+        with self._lock:
+            finished, self._finished = self._finished, []
+        if not finished:
+            return 0
+        missed = {}
+        for session in finished:
+            if session.outcome == 'missed':
+                missed[session.callee_id] = missed.get(session.callee_id, 0) + 1
+        try:
+            # Bulk inserts skip Message.deliver and the after_insert hooks, so the
+            # conversation summaries and badge counts are brought up to date here
+            db.session.execute(insert(Message), [session.record() for session in finished])
+            for user_id, count in missed.items():
+                UnreadCounter.adjust(db.session, user_id, messages=count)
+            for pair in {self.pair(session.caller_id, session.callee_id) for session in finished}:
+                ConversationSummary.for_pair(*pair).refresh()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._finished[:0] = finished
+            raise
+        return len(finished)
+
+    def _notify_expired(self, session):
+        if session.outcome == 'missed':
+            event, payload = 'call_missed', {
+                'caller_id': session.caller_id,
+                'callee_id': session.callee_id,
+                'call_type': session.call_type
+            }
+        else:
+            # Nobody hung up; both sides' heartbeats stopped renewing the lease
+            event, payload = 'call_ended', {'ended_by': None, 'duration': session.duration}
+        socketio.emit(event, payload, to=user_room(session.caller_id))
+        socketio.emit(event, payload, to=user_room(session.callee_id))
+
+    def _start_worker(self):
+        if self._worker_started:
+            return
+        with self._lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+        socketio.start_background_task(self._worker)
+
+    def _worker(self):
+        next_flush = time.monotonic()
+        while True:
+            socketio.sleep(1)
+            try:
+                for session in self.expire():
+                    self._notify_expired(session)
+            except Exception as e:
+                self.app.logger.error(f"Call expiry failed: {str(e)}")
+
+            if time.monotonic() < next_flush:
+                continue
+            next_flush = time.monotonic() + self.app.config['CALL_RECORD_FLUSH_INTERVAL']
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception as e:
+                    self.app.logger.error(f"Call record flush failed: {str(e)}")
+
+
+# Global instance
+call_registry = CallRegistry()
@@ -0,0 +1,158 @@
+"""
+Per-user discovery queues
+Keeps a persisted, ranked list of candidate ids per user so /discover only
+reads the next page. A background task refills queues that run low.
+"""
+import threading
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, delete, insert, func, or_
+
+from app import socketio
+from app.models import db, User, DiscoveryQueueEntry, SeenSet, birth_date_range
+from app.scoring import candidate_scorer, AGE_BAND_YEARS
+from app.social_graph import social_graph
+
+
+class DiscoveryQueue:
+    def __init__(self):
+        self.app = None
+        self._pending = set()
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._worker_started = False
+
+    def init_app(self, app):
+        self.app = app
+
+    # Reads
+
+    def next_page(self, user, limit):
+        """Candidate ids for the next page of user's feed, best first"""
+        candidate_ids = self._peek(user.id, limit)
+        if len(candidate_ids) < limit:
+            # Empty or nearly empty queue (first visit): fill it inline once
+            self.refill(user)
+            candidate_ids = self._peek(user.id, limit)
+        elif self.size(user.id) < current_app.config['DISCOVERY_QUEUE_LOW_WATERMARK']:
+            self.request_refill(user.id)
+        return candidate_ids
+
+    def size(self, user_id):
+        return db.session.execute(
+            select(func.count()).select_from(DiscoveryQueueEntry)
+            .where(DiscoveryQueueEntry.user_id == user_id)
+        ).scalar()
+
+    def _peek(self, user_id, limit):
+        return db.session.execute(
+            select(DiscoveryQueueEntry.candidate_id)
+            .where(DiscoveryQueueEntry.user_id == user_id)
+            .order_by(DiscoveryQueueEntry.position)
+            .limit(limit)
+        ).scalars().all()
+
+    # Invalidation, run inside the caller's transaction
+
+    def drop(self, user_id, candidate_id):
+        """Remove a candidate from one user's queue (like, pass)"""
+        db.session.execute(delete(DiscoveryQueueEntry).where(
+            DiscoveryQueueEntry.user_id == user_id,
+            DiscoveryQueueEntry.candidate_id == candidate_id
+        ))
+
+    def drop_pair(self, user_a_id, user_b_id):
+        """Remove two users from each other's queues (block)"""
+        self.drop(user_a_id, user_b_id)
+        self.drop(user_b_id, user_a_id)
+
+    def drop_user(self, user_id):
+        """Remove a user from every queue and clear their own (deactivation)"""
+        db.session.execute(delete(DiscoveryQueueEntry).where(or_(
+            DiscoveryQueueEntry.user_id == user_id,
+            DiscoveryQueueEntry.candidate_id == user_id
+        )))
+
+    # Refill
+
+    def excluded_ids(self, user_id):
+        """Ids that must never be queued for user: self, blocks both ways, liked or passed"""
+        blocked = social_graph.blocked_ids(user_id)
+        return np.concatenate([
+            SeenSet.ids_for(user_id).astype(np.int64),
+            np.array([user_id, *blocked], dtype=np.int64)
+        ])
+
+    def age_window(self, user):
+        """date_of_birth bounds for user's feed: within AGE_BAND_YEARS of their age"""
+        if not user.age:
+            return None
+        return birth_date_range(
+            max(current_app.config['MIN_AGE'], user.age - AGE_BAND_YEARS),
+            min(current_app.config['MAX_AGE'], user.age + AGE_BAND_YEARS)
+        )
+
+    def refill(self, user):
+        """Top the queue up to DISCOVERY_QUEUE_SIZE with the best unqueued candidates"""
+        with self._lock:
+            if user.id in self._refilling:
+                return
+            self._refilling.add(user.id)
+        try:
+            queued = db.session.execute(
+                select(DiscoveryQueueEntry.candidate_id, DiscoveryQueueEntry.position)
+                .where(DiscoveryQueueEntry.user_id == user.id)
+            ).all()
+            wanted = current_app.config['DISCOVERY_QUEUE_SIZE'] - len(queued)
+            if wanted <= 0:
+                return
+
+            exclude = np.concatenate([
+                self.excluded_ids(user.id),
+                np.array([candidate_id for candidate_id, _ in queued], dtype=np.int64)
+            ])
+            candidate_ids, scores = candidate_scorer.rank(user, wanted, exclude, born_between=self.age_window(user))
+            if not candidate_ids:
+                return
+
+            start = max((position for _, position in queued), default=-1) + 1
+            db.session.execute(
+                insert(DiscoveryQueueEntry).prefix_with('OR IGNORE', dialect='sqlite'),
+                [{'user_id': user.id, 'candidate_id': candidate_id,
+                  'position': start + offset, 'score': score}
+                 for offset, (candidate_id, score) in enumerate(zip(candidate_ids, scores))]
+            )
+            db.session.commit()
+        finally:
+            with self._lock:
+                self._refilling.discard(user.id)
+
+    def request_refill(self, user_id):
+        """Schedule a background refill for user"""
+        with self._lock:
+            self._pending.add(user_id)
+            if self._worker_started:
+                return
+            self._worker_started = True
+        socketio.start_background_task(self._worker)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, set()
+            if pending:
+                with self.app.app_context():
+                    for user_id in pending:
+                        try:
+                            user = db.session.get(User, user_id)
+                            if user and user.is_active:
+                                self.refill(user)
+                        except Exception as e:
+                            db.session.rollback()
+                            current_app.logger.error(f"Discovery queue refill failed for {user_id}: {str(e)}")
+            socketio.sleep(self.app.config['DISCOVERY_REFILL_INTERVAL'])
+
+
+# Global instance
+discovery_queue = DiscoveryQueue()
@@ -0,0 +1,106 @@
+"""
+Structured signaling event log
+Socket handlers record events as small dicts into a bounded ring buffer instead
+of printing. A background task drains new events to the 'signaling' logger in
+batches, so handlers never block on stdout, and chatty events (ICE candidates,
+heartbeats) are sampled. Events below SIGNALING_LOG_LEVEL return after a
+single integer comparison; the logger has its own level and handler, so the
+app logger's level doesn't filter them again.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from app import socketio
+
+OFF = logging.CRITICAL + 10
+
+
+class SignalingEventLog:
+    def __init__(self):
+        self.app = None
+        self.level = OFF
+        # Own level and handler: the app logger sits at WARNING in production
+        self.logger = logging.getLogger('signaling')
+        self._sample = {}  # event -> fraction kept
+        self._recent = deque(maxlen=1000)  # last events, for the admin dump
+        self._pending = deque(maxlen=1000)  # events not yet written to the logger
+        self._lock = threading.Lock()
+        self._worker_started = False
+
+    def init_app(self, app):
+        self.app = app
+        level = logging.getLevelName(str(app.config['SIGNALING_LOG_LEVEL']).upper())
+        self.level = level if isinstance(level, int) else OFF  # 'OFF' or unknown names
+        self.logger.setLevel(self.level)
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+        self.logger.propagate = False
+        self._sample = dict(app.config['SIGNALING_LOG_SAMPLE'])
+        self._recent = deque(maxlen=app.config['SIGNALING_LOG_BUFFER'])
+        self._pending = deque(maxlen=app.config['SIGNALING_LOG_BUFFER'])
+
+    def log(self, level, event, **fields):
+        """Record one event; dropped cheaply when below the level or sampled out"""
+        if level < self.level:
+            return
+        rate = self._sample.get(event)
+        if rate is not None and random.random() >= rate:
+            return
+        record = {'ts': time.time(), 'level': logging.getLevelName(level), 'event': event}
+        record.update(fields)
+        # deque appends are atomic, and maxlen drops the oldest when the drain falls behind
+        self._recent.append(record)
+        self._pending.append(record)
+        if not self._worker_started:
+            self._start_worker()
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def recent(self, limit=100, event=None):
+        """Newest-first snapshot of buffered events, optionally for one event name"""
+        records = [r for r in reversed(list(self._recent)) if event is None or r['event'] == event]
+        return records[:limit]
+
+    def drain(self):
+        """Write pending events to the signaling logger; returns how many were written"""
+        written = 0
+        while True:
+            try:
+                record = self._pending.popleft()
+            except IndexError:
+                return written
+            self.logger.log(logging.getLevelName(record['level']),
+                                json.dumps(record, default=str))
+            written += 1
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+        socketio.start_background_task(self._worker)
+
+    def _worker(self):
+        while True:
+            socketio.sleep(self.app.config['SIGNALING_LOG_FLUSH_INTERVAL'])
+            try:
+                self.drain()
+            except Exception as e:
+                self.app.logger.error(f"Signaling log drain failed: {str(e)}")
+
+
+# Global instance
+signal_log = SignalingEventLog()
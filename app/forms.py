@@ -169,6 +169,7 @@ class ReportForm(FlaskForm):
 
 
 class SearchForm(FlaskForm):
+    keywords = StringField('Keywords', validators=[Optional()])
     username = StringField('Username', validators=[Optional()])
     age_min = SelectField('Min Age', choices=[('', 'Any')] + [(str(i), str(i)) for i in range(18, 101)], validators=[Optional()])
     age_max = SelectField('Max Age', choices=[('', 'Any')] + [(str(i), str(i)) for i in range(18, 101)], validators=[Optional()])
@@ -6,11 +6,44 @@ from groq import Groq
 from flask import current_app
 import json
 import re
+from contextvars import ContextVar
+
+from app.offload import NativePool, SingleFlight
+
+# Set when a feature method answers with canned text instead of the model's output
+_used_fallback = ContextVar('groq_used_fallback', default=False)
 
 
 class GroqService:
     def __init__(self):
         self.client = None
+        self.pool = NativePool()  # upstream calls run on native threads, not the eventlet hub
+        self.flights = SingleFlight()  # identical concurrent requests share one upstream call
+    
+    def init_app(self, app):
+        self.pool.configure(app.config['GROQ_MAX_CONCURRENCY'])
+    
+    def mark_fallback(self):
+        """Flag the enclosing call_tracked as having produced canned output"""
+        _used_fallback.set(True)
+    
+    def _fallback(self, value):
+        self.mark_fallback()
+        return value
+    
+    def call_tracked(self, fn, *args, **kwargs):
+        """(fn's result, whether a feature method inside it fell back to canned output)"""
+        token = _used_fallback.set(False)
+        used_fallback = False
+        try:
+            result = fn(*args, **kwargs)
+            used_fallback = _used_fallback.get()
+            return result, used_fallback
+        finally:
+            _used_fallback.reset(token)
+            if used_fallback:
+                # Nested inside another call_tracked: the outer call fell back too
+                self.mark_fallback()
     
     def _get_client(self):
         """Initialize Groq client if not already done"""
@@ -18,7 +51,11 @@ class GroqService:
             api_key = current_app.config.get('GROQ_API_KEY')
             if not api_key or api_key == 'gsk_your_api_key_here':
                 raise ValueError("Groq API key not configured. Please set GROQ_API_KEY in config or environment.")
-            self.client = Groq(api_key=api_key)
+            self.client = Groq(
+                api_key=api_key,
+                timeout=current_app.config['GROQ_TIMEOUT'],
+                max_retries=current_app.config['GROQ_MAX_RETRIES']
+            )
         return self.client
     
     def _call_groq(self, prompt, system_message="You are a helpful AI assistant for a tech-focused dating app.", temperature=0.7, max_tokens=1024):
@@ -27,14 +64,19 @@ class GroqService:
             client = self._get_client()
             model = current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
             
-            response = client.chat.completions.create(
+            key = ('completion', model, system_message, prompt, temperature, max_tokens)
+            response = self.flights.do(
+                key,
+                self.pool.run,
+                client.chat.completions.create,
                 model=model,
                 messages=[
                     {"role": "system", "content": system_message},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                queue_timeout=current_app.config['GROQ_QUEUE_TIMEOUT']
             )
             
             return response.choices[0].message.content
@@ -97,15 +139,62 @@ Return only the conversation starters, nothing else."""
             return starters[:count] if starters else [response]
         except Exception as e:
             current_app.logger.error(f"Error generating conversation starters: {str(e)}")
-            return [
+            return self._fallback([
                 f"I noticed we both are into {match_interests.split(',')[0] if match_interests else 'tech'}. What project are you working on?",
                 f"Your profile caught my eye! What got you interested in {match_profile.current_role or 'tech'}?",
                 "I'm always looking to learn new things. What's something you're passionate about teaching?"
-            ]
+            ])
+    
+    def _stream_groq(self, prompt, system_message, temperature=0.7, max_tokens=1024):
+        """Yield completion text as Groq produces it.
+        
+        Holds one pool slot for the whole stream and pulls each chunk on a native
+        thread. Closing the generator (e.g. the browser went away) closes the
+        upstream stream.
+        """
+        client = self._get_client()
+        model = current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
+        
+        with self.pool.slot(current_app.config['GROQ_QUEUE_TIMEOUT']):
+            stream = self.pool.execute(
+                client.chat.completions.create,
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            try:
+                while True:
+                    chunk = self.pool.execute(next, stream, None)
+                    if chunk is None:
+                        return
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        yield text
+            finally:
+                stream.close()
     
     # Feature 2: Profile Bio Enhancement
     def enhance_bio(self, current_bio, user_data):
         """Suggest improvements or generate a bio based on user data"""
+        prompt, system_message = self._enhance_bio_prompt(current_bio, user_data)
+        
+        try:
+            return self._call_groq(prompt, system_message, temperature=0.8, max_tokens=800)
+        except Exception as e:
+            current_app.logger.error(f"Error enhancing bio: {str(e)}")
+            return None
+    
+    def enhance_bio_stream(self, current_bio, user_data):
+        """enhance_bio, yielding the suggestions as they are generated"""
+        prompt, system_message = self._enhance_bio_prompt(current_bio, user_data)
+        return self._stream_groq(prompt, system_message, temperature=0.8, max_tokens=800)
+    
+    def _enhance_bio_prompt(self, current_bio, user_data):
         if current_bio:
             prompt = f"""Improve this dating profile bio for a tech professional. Make it more engaging while keeping the core message.
 
@@ -148,12 +237,7 @@ Create 3 different bio options (each 2-3 sentences), each with a different tone:
 Format clearly with headers."""
 
         system_message = "You are an expert at writing engaging dating profiles for tech professionals. Be authentic, interesting, and help people show their personality."
-        
-        try:
-            return self._call_groq(prompt, system_message, temperature=0.8, max_tokens=800)
-        except Exception as e:
-            current_app.logger.error(f"Error enhancing bio: {str(e)}")
-            return None
+        return prompt, system_message
     
     # Feature 3: Intelligent Matchmaking Analysis
     def analyze_compatibility(self, user_profile, match_profile):
@@ -259,14 +343,59 @@ Return ONLY valid JSON."""
         except Exception as e:
             current_app.logger.error(f"Error moderating content: {str(e)}")
             # Fail open for now
-            return {
+            return self._fallback({
                 "is_safe": True,
                 "risk_level": "low",
                 "issues": [],
                 "suggested_action": "allow",
                 "reason": "Moderation service unavailable"
-            }
-    
+            })
+
+    def moderate_batch(self, items):
+        """moderate_content for several (content_type, content) items in one call.
+
+        Returns one verdict per item, in order, or None where the model's answer
+        has no usable verdict for it. Raises when the call itself fails.
+        """
+        # Each item is JSON-quoted so its text can't pose as another item or as instructions
+        numbered = "\n".join(
+            f"[{i}] ({content_type}) {json.dumps(content)}" for i, (content_type, content) in enumerate(items, 1)
+        )
+        prompt = f"""Review each numbered item from a tech-focused dating platform. Check for:
+- Harassment or hate speech
+- Sexual content (explicit)
+- Spam or scam attempts
+- Personal information sharing (phone, email, address)
+- Unsafe requests or propositions
+
+Items:
+{numbered}
+
+Respond with a JSON array holding one object per item:
+[
+  {{
+    "id": <item number>,
+    "is_safe": <true/false>,
+    "risk_level": "<low/medium/high>",
+    "issues": ["issue1", "issue2"],
+    "suggested_action": "<allow/warn/block>",
+    "reason": "brief explanation"
+  }}
+]
+
+Return ONLY valid JSON."""
+
+        system_message = "You are a content moderation AI for a dating platform. Be thorough but fair. Allow flirting but block harassment."
+
+        response = self._call_groq(prompt, system_message, temperature=0.3, max_tokens=64 + 128 * len(items))
+        json_match = re.search(r'\[.*\]', response, re.DOTALL)
+        verdicts = {}
+        if json_match:
+            for verdict in json.loads(json_match.group()):
+                if isinstance(verdict, dict) and isinstance(verdict.get('id'), int):
+                    verdicts[verdict.pop('id')] = verdict
+        return [verdicts.get(i) for i in range(1, len(items) + 1)]
+
     # Feature 5: Date Ideas Generator
     def generate_date_ideas(self, user_profile, match_profile, count=5):
         """Generate personalized date ideas based on both profiles"""
@@ -311,15 +440,29 @@ Be creative but realistic."""
             return ideas[:count] if ideas else [{"title": "Tech Talk Coffee Date", "description": response}]
         except Exception as e:
             current_app.logger.error(f"Error generating date ideas: {str(e)}")
-            return [
+            return self._fallback([
                 {"title": "Coffee & Code", "description": "Meet at a cozy cafe and chat about your latest projects over coffee."},
                 {"title": "Tech Museum Visit", "description": "Explore interactive exhibits and discuss innovation together."},
                 {"title": "Pair Programming Session", "description": "Work on a fun mini-project together at a co-working space."}
-            ]
+            ])
     
     # Feature 6: Message Coaching
     def coach_message(self, message_draft, context=None):
         """Provide feedback on a message draft"""
+        prompt, system_message = self._coach_message_prompt(message_draft, context)
+        
+        try:
+            return self._call_groq(prompt, system_message, temperature=0.7, max_tokens=512)
+        except Exception as e:
+            current_app.logger.error(f"Error coaching message: {str(e)}")
+            return self._fallback("Your message looks good! Just be yourself and keep the conversation flowing naturally.")
+    
+    def coach_message_stream(self, message_draft, context=None):
+        """coach_message, yielding the feedback as it is generated"""
+        prompt, system_message = self._coach_message_prompt(message_draft, context)
+        return self._stream_groq(prompt, system_message, temperature=0.7, max_tokens=512)
+    
+    def _coach_message_prompt(self, message_draft, context):
         prompt = f"""You're helping someone improve a message they want to send on a dating app.
 
 Their draft message:
@@ -335,12 +478,7 @@ Provide:
 Be encouraging but honest. Format clearly."""
 
         system_message = "You are a helpful dating coach. Give constructive feedback to help people communicate better."
-        
-        try:
-            return self._call_groq(prompt, system_message, temperature=0.7, max_tokens=512)
-        except Exception as e:
-            current_app.logger.error(f"Error coaching message: {str(e)}")
-            return "Your message looks good! Just be yourself and keep the conversation flowing naturally."
+        return prompt, system_message
     
     # Feature 7: Profile Insights
     def generate_profile_insights(self, user_profile, stats):
@@ -377,7 +515,7 @@ Be specific, actionable, and encouraging."""
             return self._call_groq(prompt, system_message, temperature=0.7, max_tokens=1024)
         except Exception as e:
             current_app.logger.error(f"Error generating insights: {str(e)}")
-            return "Keep your profile updated and engage authentically with matches. Quality photos and a complete bio make a big difference!"
+            return self._fallback("Keep your profile updated and engage authentically with matches. Quality photos and a complete bio make a big difference!")
 
 
 # Global instance
@@ -0,0 +1,86 @@
+"""
+Identity cache for Flask-Login
+The user_loader runs on every request, and nearly every page then touches
+current_user.profile. This keeps a small LRU of user + profile column values
+per worker. A hit is attached to the request's session with merge(load=False),
+which issues no SQL, so current_user stays a normal, writable ORM object.
+
+Entries carry the user's version; routes that change a user or profile call
+invalidate(), which bumps it. Other workers don't see the bump, so entries
+also expire after IDENTITY_CACHE_TTL seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models import db, User, Profile
+
+
+def _columns(instance):
+    return {attr.key: getattr(instance, attr.key) for attr in instance.__mapper__.column_attrs}
+
+
+class IdentityCache:
+    def __init__(self):
+        self.app = None
+        self._entries = OrderedDict()  # user_id -> (version, expires_at, user columns, profile columns)
+        self._versions = {}  # user_id -> version, bumped on every invalidation
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+
+    def load(self, user_id):
+        """current_user for user_id, from the cache when the entry is fresh"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            version = self._versions.get(user_id, 0)
+            if entry is not None and (entry[0] != version or entry[1] < now):
+                del self._entries[user_id]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+
+        if entry is not None:
+            return db.session.merge(self._detached(entry[2], entry[3]), load=False)
+
+        user = db.session.get(User, user_id, options=[joinedload(User.profile)])
+        if user is None:
+            return None
+        ttl = self.app.config['IDENTITY_CACHE_TTL']
+        profile = _columns(user.profile) if user.profile else None
+        with self._lock:
+            # Skip the store if an invalidation raced with the load
+            if self._versions.get(user_id, 0) == version:
+                self._entries[user_id] = (version, now + ttl, _columns(user), profile)
+                while len(self._entries) > self.app.config['IDENTITY_CACHE_SIZE']:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, *user_ids):
+        """Forget cached identities; call after changing a user or their profile"""
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                self._entries.pop(user_id, None)
+
+    @staticmethod
+    def _detached(user_columns, profile_columns):
+        """Fresh detached User (and Profile) that merge() can attach without a SELECT"""
+        user = User(**user_columns)
+        make_transient_to_detached(user)
+        profile = None
+        if profile_columns is not None:
+            profile = Profile(**profile_columns)
+            make_transient_to_detached(profile)
+        # Set without history so the merged copy starts clean
+        set_committed_value(user, 'profile', profile)
+        return user
+
+
+# Global instance
+identity_cache = IdentityCache()
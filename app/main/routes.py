@@ -1,10 +1,20 @@
 from flask import render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app import db
-from app.models import User, Profile, Like, Match, Message, Notification, Report
+from app.models import User, Profile, Like, Match, Message, Notification, Report, ConversationSummary, SeenSet
 from app.forms import MessageForm, SearchForm, ReportForm
+from app.discovery_queue import discovery_queue
+from app.message_events import mark_conversation_read
+from app.search_index import search_index
+from app.event_log import signal_log
+from app.identity_cache import identity_cache
+from app.social_graph import social_graph
+from app.ai_cache import ai_cache
+from app.ai_jobs import ai_jobs
+from app.moderation import moderation
 from datetime import datetime
 from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
 from app.main import main
 import os
 from werkzeug.utils import secure_filename
@@ -18,43 +28,35 @@ def index():
     return render_template('index.html')
 
 
+def _match_summaries(*order_by):
+    """Current user's matches joined to their conversation summaries in one query"""
+    rows = db.session.query(Match, ConversationSummary).outerjoin(
+        ConversationSummary,
+        and_(ConversationSummary.user1_id == Match.user1_id,
+             ConversationSummary.user2_id == Match.user2_id)
+    ).filter(
+        or_(Match.user1_id == current_user.id, Match.user2_id == current_user.id)
+    ).options(
+        joinedload(Match.user1).joinedload(User.profile),
+        joinedload(Match.user2).joinedload(User.profile)
+    ).order_by(*order_by).all()
+    
+    return [{
+        'user': match.get_other_user(current_user.id),
+        'match': match,
+        'summary': summary,
+        'unread_count': summary.unread_count_for(current_user.id) if summary else 0
+    } for match, summary in rows]
+
+
 @main.route('/conversations')
 @login_required
 def conversations():
-    # Get all matches with their last messages
-    matches = Match.query.filter(
-        or_(Match.user1_id == current_user.id, Match.user2_id == current_user.id)
-    ).order_by(Match.matched_at.desc()).all()
-    
-    conversations = []
-    for match in matches:
-        other_user = match.user2 if match.user1_id == current_user.id else match.user1
-        
-        # Get last message
-        last_message = Message.query.filter(
-            or_(
-                and_(Message.sender_id == current_user.id, Message.receiver_id == other_user.id),
-                and_(Message.sender_id == other_user.id, Message.receiver_id == current_user.id)
-            ),
-            Message.is_deleted == False
-        ).order_by(Message.sent_at.desc()).first()
-        
-        # Get unread count
-        unread_count = Message.query.filter_by(
-            sender_id=other_user.id,
-            receiver_id=current_user.id,
-            is_read=False,
-            is_deleted=False
-        ).count()
-        
-        conversations.append({
-            'user': other_user,
-            'last_message': last_message,
-            'unread_count': unread_count
-        })
-    
-    # Sort by last message timestamp
-    conversations.sort(key=lambda x: x['last_message'].sent_at if x['last_message'] else datetime.min, reverse=True)
+    # Most recently active conversations first, untouched matches last
+    conversations = _match_summaries(
+        ConversationSummary.last_activity_at.desc().nullslast(),
+        Match.matched_at.desc()
+    )
     
     from datetime import timedelta
     return render_template('main/conversations.html', conversations=conversations, datetime=datetime, timedelta=timedelta)
@@ -63,26 +65,15 @@ def conversations():
 @main.route('/discover')
 @login_required
 def discover():
-    # Get users that current user hasn't liked/passed and haven't blocked
-    blocked_ids = [user.id for user in current_user.blocked.all()]
-    blocked_by_ids = [user.id for user in current_user.blocked_by.all()]
-    liked_ids = [like.liked_id for like in current_user.sent_likes.all()]
-    
-    exclude_ids = set([current_user.id] + blocked_ids + blocked_by_ids + liked_ids)
-    
-    # Get potential matches based on preferences
-    query = User.query.filter(
-        User.id.notin_(exclude_ids),
-        User.is_active == True
-    )
-    
-    # Filter by age range (example: ±10 years)
-    if current_user.age:
-        age_min = max(18, current_user.age - 10)
-        age_max = current_user.age + 10
-        # This is a simplified age filter - in production, you'd calculate birth year ranges
-    
-    users = query.limit(20).all()
+    # Next page of the precomputed, ranked queue
+    candidate_ids = discovery_queue.next_page(current_user, current_app.config['USERS_PER_PAGE'])
+    users_by_id = {
+        user.id: user for user in User.query.options(joinedload(User.profile)).filter(
+            User.id.in_(candidate_ids),
+            User.is_active == True
+        ).all()
+    }
+    users = [users_by_id[user_id] for user_id in candidate_ids if user_id in users_by_id]
     
     # Get match count
     matches_count = Match.query.filter(
@@ -107,6 +98,8 @@ def like_user(user_id):
     # Create like
     like = Like(liker_id=current_user.id, liked_id=user_id)
     db.session.add(like)
+    SeenSet.record(current_user.id, user_id)
+    discovery_queue.drop(current_user.id, user_id)
     
     # Check if it's a match
     is_match = False
@@ -117,6 +110,7 @@ def like_user(user_id):
             user2_id=max(current_user.id, user_id)
         )
         db.session.add(match)
+        ConversationSummary.for_pair(current_user.id, user_id)
         is_match = True
         
         # Create notifications for both users
@@ -145,6 +139,9 @@ def like_user(user_id):
         db.session.add(notif)
     
     db.session.commit()
+    social_graph.add_like(current_user.id, user_id)
+    if is_match:
+        ai_jobs.enqueue_match(current_user.id, user_id)
     
     return jsonify({
         'success': True,
@@ -156,44 +153,19 @@ def like_user(user_id):
 @main.route('/pass/<int:user_id>', methods=['POST'])
 @login_required
 def pass_user(user_id):
-    # For now, we'll just create a "pass" like with a flag
-    # In a full implementation, you might want a separate Pass model
+    if user_id == current_user.id:
+        return jsonify({'error': 'Cannot pass on yourself'}), 400
+    
+    SeenSet.record(current_user.id, user_id)
+    discovery_queue.drop(current_user.id, user_id)
+    db.session.commit()
     return jsonify({'success': True, 'message': 'Passed'})
 
 
 @main.route('/matches')
 @login_required
 def matches():
-    # Get all matches
-    user_matches = Match.query.filter(
-        or_(Match.user1_id == current_user.id, Match.user2_id == current_user.id)
-    ).order_by(Match.matched_at.desc()).all()
-    
-    match_users = []
-    for match in user_matches:
-        other_user = match.get_other_user(current_user.id)
-        
-        # Get last message
-        last_message = Message.query.filter(
-            or_(
-                and_(Message.sender_id == current_user.id, Message.receiver_id == other_user.id),
-                and_(Message.sender_id == other_user.id, Message.receiver_id == current_user.id)
-            )
-        ).order_by(Message.sent_at.desc()).first()
-        
-        # Get unread count
-        unread_count = Message.query.filter(
-            Message.sender_id == other_user.id,
-            Message.receiver_id == current_user.id,
-            Message.is_read == False
-        ).count()
-        
-        match_users.append({
-            'user': other_user,
-            'match': match,
-            'last_message': last_message,
-            'unread_count': unread_count
-        })
+    match_users = _match_summaries(Match.matched_at.desc())
     
     return render_template('main/matches.html', matches=match_users)
 
@@ -258,9 +230,9 @@ def messages(user_id):
             # Check if rich text
             is_rich_text = form.is_rich_text.data == 'true'
             
-            message = Message(
-                sender_id=current_user.id,
-                receiver_id=user_id,
+            message = Message.deliver(
+                current_user,
+                user_id,
                 content=content,
                 message_type=message_type,
                 file_url=file_url,
@@ -268,56 +240,63 @@ def messages(user_id):
                 file_size=file_size,
                 is_rich_text=is_rich_text
             )
-            db.session.add(message)
-            
-            # Create notification
-            notif = Notification(
-                user_id=user_id,
-                type='new_message',
-                content=f'New message from {current_user.username}',
-                related_user_id=current_user.id
-            )
-            db.session.add(notif)
-            
             db.session.commit()
+            if content:
+                moderation.submit('message', message.id, current_user.id, content)
         
         return redirect(url_for('main.messages', user_id=user_id))
     
-    # Get all messages between users
-    messages_list = Message.query.filter(
-        or_(
-            and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
-            and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
-        )
-    ).order_by(Message.sent_at.asc()).all()
-    
-    # Mark messages as read
-    unread_messages = Message.query.filter(
-        Message.sender_id == user_id,
-        Message.receiver_id == current_user.id,
-        Message.is_read == False
-    ).all()
-    
-    for msg in unread_messages:
-        msg.is_read = True
-        msg.read_at = datetime.utcnow()
+    # Newest page only; older pages are fetched from message_history as the user scrolls up
+    messages_list, has_more = Message.conversation_page(
+        current_user.id, user_id, current_app.config['MESSAGES_PER_PAGE']
+    )
     
-    if unread_messages:
-        db.session.commit()
+    # Everything up to the newest message on screen is now read
+    if messages_list:
+        mark_conversation_read(current_user.id, user_id, messages_list[-1].id)
     
     return render_template('main/messages.html', 
                          other_user=other_user, 
                          messages=messages_list, 
+                         has_more=has_more,
                          form=form)
 
 
+@main.route('/api/messages/<int:user_id>/history')
+@login_required
+def message_history(user_id):
+    """Page of messages older than the ``before`` message id, rendered for prepending"""
+    other_user = User.query.get_or_404(user_id)
+    
+    if not current_user.has_matched(other_user):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    before = None
+    before_id = request.args.get('before', type=int)
+    if before_id is not None:
+        before = Message.query.get_or_404(before_id)
+        if {before.sender_id, before.receiver_id} != {current_user.id, user_id}:
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    messages_list, has_more = Message.conversation_page(
+        current_user.id, user_id, current_app.config['MESSAGES_PER_PAGE'], before=before
+    )
+    
+    return jsonify({
+        'success': True,
+        'html': ''.join(render_template('main/_message.html', message=message) for message in messages_list),
+        'has_more': has_more,
+        'next_cursor': messages_list[0].id if messages_list else None
+    })
+
+
 @main.route('/profile/<int:user_id>')
 @login_required
 def view_profile(user_id):
     user = User.query.get_or_404(user_id)
     
     # Check if blocked
-    if current_user.has_blocked(user) or user.has_blocked(current_user):
+    if current_user.has_blocked(user) or current_user.is_blocked_by(user):
         flash('This profile is not available.', 'warning')
         return redirect(url_for('main.discover'))
     
@@ -339,27 +318,34 @@ def search():
     
     if request.method == 'POST' or request.args.get('submit'):
         # Get blocked users to exclude
-        blocked_ids = [user.id for user in current_user.blocked.all()]
-        blocked_by_ids = [user.id for user in current_user.blocked_by.all()]
-        exclude_ids = set([current_user.id] + blocked_ids + blocked_by_ids)
+        exclude_ids = social_graph.blocked_ids(current_user.id) | {current_user.id}
         
         query = User.query.filter(
             User.id.notin_(exclude_ids),
             User.is_active == True
         )
         
-        # Apply username filter
-        if form.username.data:
-            query = query.filter(User.username.ilike(f'%{form.username.data}%'))
-        
-        # Apply city filter
-        if form.city.data:
-            query = query.filter(User.city.ilike(f'%{form.city.data}%'))
+        # Text filters go through the full-text index, ranked by bm25
+        expression = search_index.match_expression({
+            None: form.keywords.data,
+            'username': form.username.data,
+            'city': form.city.data,
+            'current_role': form.current_role.data,
+        }) if search_index.enabled else ''
+        if expression:
+            hits = search_index.matches(expression)
+            query = query.join(hits, hits.c.user_id == User.id).order_by(hits.c.rank)
+        elif not search_index.enabled:
+            if form.username.data:
+                query = query.filter(User.username.ilike(f'%{form.username.data}%'))
+            if form.city.data:
+                query = query.filter(User.city.ilike(f'%{form.city.data}%'))
+            # Keywords need the index; other databases only get the column filters
         
         # Join with Profile for profile-specific filters
         needs_profile_join = (form.experience_level.data or 
-                            form.current_role.data or 
-                            form.collaboration_interest.data)
+                            form.collaboration_interest.data or
+                            (form.current_role.data and not search_index.enabled))
         
         if needs_profile_join:
             query = query.join(Profile)
@@ -369,27 +355,19 @@ def search():
             query = query.filter(Profile.experience_level == form.experience_level.data)
         
         # Apply role filter
-        if form.current_role.data:
+        if form.current_role.data and not search_index.enabled:
             query = query.filter(Profile.current_role.ilike(f'%{form.current_role.data}%'))
         
         # Apply collaboration interest filter
         if form.collaboration_interest.data:
             query = query.filter(Profile.collaboration_interest == form.collaboration_interest.data)
         
-        # Apply age filters
-        if form.age_min.data:
-            # Calculate max birth year
-            from datetime import date
-            today = date.today()
-            max_birth_year = today.year - int(form.age_min.data)
-            query = query.filter(User.date_of_birth <= date(max_birth_year, 12, 31))
-        
-        if form.age_max.data:
-            # Calculate min birth year
-            from datetime import date
-            today = date.today()
-            min_birth_year = today.year - int(form.age_max.data)
-            query = query.filter(User.date_of_birth >= date(min_birth_year, 1, 1))
+        # Apply age filters as exact date_of_birth bounds
+        if form.age_min.data or form.age_max.data:
+            query = query.filter(User.age_between(
+                int(form.age_min.data) if form.age_min.data else None,
+                int(form.age_max.data) if form.age_max.data else None
+            ))
         
         users = query.limit(100).all()
     
@@ -433,6 +411,8 @@ def delete_message(message_id):
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
     message.is_deleted = True
+    db.session.flush()
+    ConversationSummary.for_pair(message.sender_id, message.receiver_id).refresh()
     db.session.commit()
     
     return jsonify({'success': True})
@@ -445,17 +425,35 @@ def typing_indicator(user_id):
     return jsonify({'success': True, 'user_id': current_user.id})
 
 
+@main.route('/api/admin/signaling-events')
+@login_required
+def signaling_events():
+    """Recent call signaling events from this worker's ring buffer (admins only)"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    limit = min(request.args.get('limit', 100, type=int), current_app.config['SIGNALING_LOG_BUFFER'])
+    events = signal_log.recent(limit=limit, event=request.args.get('event'))
+    return jsonify({'success': True, 'events': events})
+
+
+@main.route('/api/admin/ai-cache')
+@login_required
+def ai_cache_stats():
+    """AI result cache hit/miss counters for this worker (admins only)"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    return jsonify({'success': True, 'cache': ai_cache.stats()})
+
+
 @main.route('/notifications')
 @login_required
 def notifications():
     notifs = current_user.notifications.order_by(Notification.created_at.desc()).limit(50).all()
     
     # Mark all as read
-    for notif in notifs:
-        if not notif.is_read:
-            notif.is_read = True
-    
-    if notifs:
+    if notifs and Notification.mark_read(current_user.id, notifs[0].id):
         db.session.commit()
     
     return render_template('main/notifications.html', notifications=notifs)
@@ -471,7 +469,10 @@ def block_user(user_id):
     
     if not current_user.has_blocked(user):
         current_user.blocked.append(user)
+        discovery_queue.drop_pair(current_user.id, user.id)
         db.session.commit()
+        identity_cache.invalidate(current_user.id, user.id)
+        social_graph.add_block(current_user.id, user.id)
     
     return jsonify({'success': True, 'message': 'User blocked'})
 
@@ -0,0 +1,96 @@
+from datetime import datetime
+from flask import render_template, request
+from flask_socketio import emit
+from app import socketio
+from app.models import db, Match, Message, ConversationSummary
+from app.socket_identity import socket_identity
+from app.moderation import moderation
+
+MAX_MESSAGE_LENGTH = 5000
+
+
+def user_room(user_id):
+    """Room every socket of a user joins on connect"""
+    return f'user_{user_id}'
+
+
+def _payload(message, viewer_id):
+    """Constant-size event body: ids plus the bubble rendered for one side"""
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'sent_at': message.sent_at.isoformat(),
+        'html': render_template('main/_message.html', message=message, viewer_id=viewer_id)
+    }
+
+
+def mark_conversation_read(reader_id, other_id, up_to_id):
+    """Mark other_id's messages to reader_id read up to up_to_id and send one receipt"""
+    read_at = datetime.utcnow()
+    marked = Message.mark_read(other_id, reader_id, up_to_id, read_at)
+    if not marked:
+        return 0
+
+    ConversationSummary.for_pair(reader_id, other_id).mark_read(reader_id, up_to_id)
+    db.session.commit()
+
+    socketio.emit('messages_read', {
+        'reader_id': reader_id,
+        'up_to_id': up_to_id,
+        'read_at': read_at.isoformat()
+    }, to=user_room(other_id))
+    return marked
+
+
+@socketio.on('send_message')
+def handle_send_message(data):
+    """Persist a text message, ack the sender and push it to the receiver's room"""
+    identity = socket_identity()
+    if identity is None:
+        return {'success': False, 'message': 'Not authenticated'}
+
+    receiver_id = data.get('receiver_id')
+    content = (data.get('content') or '').strip()
+
+    if not isinstance(receiver_id, int) or not content:
+        return {'success': False, 'message': 'Invalid message'}
+    if len(content) > MAX_MESSAGE_LENGTH:
+        return {'success': False, 'message': f'Message must be less than {MAX_MESSAGE_LENGTH} characters'}
+
+    is_matched = Match.query.filter_by(
+        user1_id=min(identity.id, receiver_id),
+        user2_id=max(identity.id, receiver_id)
+    ).first() is not None
+    if not is_matched:
+        return {'success': False, 'message': "You can only message users you've matched with."}
+
+    message = Message.deliver(
+        identity,
+        receiver_id,
+        content=content,
+        is_rich_text=bool(data.get('is_rich_text'))
+    )
+    db.session.commit()
+    moderation.submit('message', message.id, identity.id, content)
+
+    emit('new_message', _payload(message, receiver_id), room=user_room(receiver_id))
+
+    # The sender's other tabs and devices show it too
+    sender_payload = _payload(message, identity.id)
+    emit('new_message', sender_payload, room=user_room(identity.id), skip_sid=request.sid)
+
+    return dict(sender_payload, success=True)
+
+
+@socketio.on('mark_read')
+def handle_mark_read(data):
+    """Reader saw everything from other_user_id up to up_to_id"""
+    identity = socket_identity()
+    if identity is None:
+        return
+
+    other_user_id = data.get('other_user_id')
+    up_to_id = data.get('up_to_id')
+    if isinstance(other_user_id, int) and isinstance(up_to_id, int):
+        mark_conversation_read(identity.id, other_user_id, up_to_id)
@@ -1,7 +1,15 @@
-from datetime import datetime
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from markupsafe import Markup
+from sqlalchemy import and_, or_, func, true, tuple_, update, insert, case, event, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.passwords import password_hasher
 
 db = SQLAlchemy()
 
@@ -24,6 +32,27 @@ blocked_users = db.Table('blocked_users',
 )
 
 
+def _years_before(day, years):
+    """Same calendar day ``years`` earlier, Feb 29 falling back to Feb 28"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def birth_date_range(age_min=None, age_max=None, today=None):
+    """(earliest, latest) date_of_birth for ages in [age_min, age_max] on ``today``.
+
+    Exact to the day and inclusive on both ends; a missing bound is None.
+    """
+    today = today or datetime.utcnow().date()
+    # Aged at least age_min: born on or before today minus age_min years
+    latest = _years_before(today, age_min) if age_min is not None else None
+    # Aged at most age_max: not yet age_max + 1, i.e. born after today minus age_max + 1 years
+    earliest = _years_before(today, age_max + 1) + timedelta(days=1) if age_max is not None else None
+    return earliest, latest
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -73,11 +102,29 @@ class User(UserMixin, db.Model):
                              backref=db.backref('blocked_by', lazy='dynamic'),
                              lazy='dynamic')
     
+    __table_args__ = (db.Index('ix_users_active_dob', 'is_active', 'date_of_birth'),)
+    
+    @classmethod
+    def age_between(cls, age_min=None, age_max=None):
+        """SQL criteria for an age window, as indexable date_of_birth bounds"""
+        earliest, latest = birth_date_range(age_min, age_max)
+        criteria = []
+        if earliest is not None:
+            criteria.append(cls.date_of_birth >= earliest)
+        if latest is not None:
+            criteria.append(cls.date_of_birth <= latest)
+        return and_(*criteria) if criteria else true()
+    
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify password, upgrading a hash made with old parameters; the caller commits"""
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     @property
     def age(self):
@@ -86,17 +133,22 @@ class User(UserMixin, db.Model):
             return today.year - self.date_of_birth.year - ((today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day))
         return None
     
+    # Answered from the in-memory social graph (app/social_graph.py)
     def has_liked(self, user):
-        return self.sent_likes.filter_by(liked_id=user.id).first() is not None
+        from app.social_graph import social_graph
+        return social_graph.has_liked(self.id, user.id)
     
     def has_matched(self, user):
-        return (self.has_liked(user) and user.has_liked(self))
+        from app.social_graph import social_graph
+        return social_graph.has_matched(self.id, user.id)
     
     def has_blocked(self, user):
-        return self.blocked.filter(blocked_users.c.blocked_id == user.id).count() > 0
+        from app.social_graph import social_graph
+        return social_graph.has_blocked(self.id, user.id)
     
     def is_blocked_by(self, user):
-        return user.has_blocked(self)
+        from app.social_graph import social_graph
+        return social_graph.is_blocked_by(self.id, user.id)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -106,7 +158,7 @@ class Profile(db.Model):
     __tablename__ = 'profiles'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     
     # Profile info
     bio = db.Column(db.Text)
@@ -137,6 +189,11 @@ class Profile(db.Model):
     # Additional photos
     photos = db.relationship('Photo', backref='profile', lazy='dynamic', cascade='all, delete-orphan')
     
+    # Trailing user_id lets filtered searches join back to users from the index alone
+    __table_args__ = (
+        db.Index('ix_profiles_experience_collaboration', 'experience_level', 'collaboration_interest', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<Profile {self.user_id}>'
 
@@ -200,7 +257,10 @@ class Match(db.Model):
     user1 = db.relationship('User', foreign_keys=[user1_id])
     user2 = db.relationship('User', foreign_keys=[user2_id])
     
-    __table_args__ = (db.UniqueConstraint('user1_id', 'user2_id', name='unique_match'),)
+    __table_args__ = (
+        db.UniqueConstraint('user1_id', 'user2_id', name='unique_match'),
+        db.Index('ix_matches_user2_id', 'user2_id'),
+    )
     
     def get_other_user(self, current_user_id):
         return self.user1 if self.user2_id == current_user_id else self.user2
@@ -216,11 +276,11 @@ class Message(db.Model):
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=True)  # Nullable for media-only messages
-    message_type = db.Column(db.String(20), default='text')  # text, voice, image, file
+    message_type = db.Column(db.String(20), default='text')  # text, voice, image, file, call
     file_url = db.Column(db.String(255), nullable=True)  # Path to uploaded file
     file_name = db.Column(db.String(255), nullable=True)  # Original filename
     file_size = db.Column(db.Integer, nullable=True)  # File size in bytes
-    duration = db.Column(db.Integer, nullable=True)  # Duration in seconds for voice notes
+    duration = db.Column(db.Integer, nullable=True)  # Duration in seconds for voice notes and calls
     sent_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     is_read = db.Column(db.Boolean, default=False)
     read_at = db.Column(db.DateTime)
@@ -228,10 +288,271 @@ class Message(db.Model):
     is_deleted = db.Column(db.Boolean, default=False)
     is_rich_text = db.Column(db.Boolean, default=False)  # Rich text formatting
     
+    __table_args__ = (
+        db.Index('ix_messages_pair_sent', 'sender_id', 'receiver_id', 'sent_at', 'id'),
+        db.Index('ix_messages_receiver_read', 'receiver_id', 'is_read'),
+    )
+    
+    @classmethod
+    def deliver(cls, sender, receiver_id, **fields):
+        """Add a message with its conversation summary update and notification"""
+        message = cls(sender_id=sender.id, receiver_id=receiver_id, **fields)
+        db.session.add(message)
+        ConversationSummary.for_pair(sender.id, receiver_id).record_message(message)
+        db.session.add(Notification(
+            user_id=receiver_id,
+            type='new_message',
+            content=f'New message from {sender.username}',
+            related_user_id=sender.id
+        ))
+        return message
+    
+    @classmethod
+    def mark_read(cls, sender_id, receiver_id, up_to_id, read_at=None):
+        """Mark everything sender_id sent receiver_id up to message up_to_id as read.
+
+        One UPDATE over the pair's index range; returns the number of messages marked.
+        """
+        result = db.session.execute(
+            update(cls).where(
+                cls.sender_id == sender_id,
+                cls.receiver_id == receiver_id,
+                cls.is_read == False,
+                cls.id <= up_to_id
+            ).values(is_read=True, read_at=read_at or datetime.utcnow())
+        )
+        UnreadCounter.adjust(db.session, receiver_id, messages=-result.rowcount)
+        return result.rowcount
+    
+    @classmethod
+    def conversation_page(cls, user_a_id, user_b_id, limit, before=None):
+        """One page of a conversation, oldest first, and whether older messages exist.
+
+        Keyset pagination on (sent_at, id): ``before`` is the oldest message already
+        shown. Each direction is an index range scan on ix_messages_pair_sent that
+        stops after limit + 1 rows; the two short lists are merged here.
+        """
+        rows = []
+        for sender_id, receiver_id in ((user_a_id, user_b_id), (user_b_id, user_a_id)):
+            query = cls.query.filter(
+                cls.sender_id == sender_id,
+                cls.receiver_id == receiver_id,
+                cls.is_deleted == False
+            )
+            if before is not None:
+                query = query.filter(tuple_(cls.sent_at, cls.id) < (before.sent_at, before.id))
+            rows.extend(query.order_by(cls.sent_at.desc(), cls.id.desc()).limit(limit + 1).all())
+        
+        rows.sort(key=lambda message: (message.sent_at, message.id), reverse=True)
+        return rows[:limit][::-1], len(rows) > limit
+    
     def __repr__(self):
         return f'<Message {self.sender_id} -> {self.receiver_id}>'
 
 
+class ConversationSummary(db.Model):
+    """Denormalized per-pair conversation state backing the inbox pages.
+
+    One row per matched pair, keyed like ``Match`` (``user1_id`` is the lower id).
+    It is kept current by the message write paths so /conversations and /matches
+    never have to scan ``messages``.
+    """
+    __tablename__ = 'conversation_summaries'
+    
+    PREVIEW_LENGTH = 120
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user1_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user2_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('messages.id'), nullable=True)
+    last_sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    last_message_type = db.Column(db.String(20))
+    last_message_preview = db.Column(db.String(PREVIEW_LENGTH))
+    last_activity_at = db.Column(db.DateTime)
+    unread_count_user1 = db.Column(db.Integer, default=0, nullable=False)
+    unread_count_user2 = db.Column(db.Integer, default=0, nullable=False)
+    
+    last_message = db.relationship('Message', foreign_keys=[last_message_id])
+    
+    __table_args__ = (
+        db.UniqueConstraint('user1_id', 'user2_id', name='unique_conversation'),
+        db.Index('ix_conversation_user1_activity', 'user1_id', 'last_activity_at'),
+        db.Index('ix_conversation_user2_activity', 'user2_id', 'last_activity_at'),
+    )
+    
+    @classmethod
+    def for_pair(cls, user_a_id, user_b_id):
+        """Get or create the summary row for a pair of users"""
+        user1_id, user2_id = min(user_a_id, user_b_id), max(user_a_id, user_b_id)
+        summary = cls.query.filter_by(user1_id=user1_id, user2_id=user2_id).first()
+        if summary is None:
+            summary = cls(user1_id=user1_id, user2_id=user2_id,
+                          unread_count_user1=0, unread_count_user2=0)
+            db.session.add(summary)
+            # Flush so later counter bumps can be issued as UPDATE expressions
+            db.session.flush()
+        return summary
+    
+    @classmethod
+    def preview_for(cls, message):
+        """Plain-text preview shown in the inbox for a message"""
+        if message.message_type == 'file':
+            text = message.file_name
+        elif message.message_type in ('voice', 'image', 'video'):
+            text = None
+        elif message.is_rich_text and message.content:
+            text = Markup(message.content).striptags()
+        else:
+            text = message.content
+        return text[:cls.PREVIEW_LENGTH] if text else None
+    
+    def _unread_column(self, user_id):
+        cls = type(self)
+        return cls.unread_count_user1 if user_id == self.user1_id else cls.unread_count_user2
+    
+    def unread_count_for(self, user_id):
+        return self.unread_count_user1 if user_id == self.user1_id else self.unread_count_user2
+    
+    def record_message(self, message):
+        """Point the summary at a new message and bump the receiver's unread count"""
+        self.last_message = message
+        self.last_sender_id = message.sender_id
+        self.last_message_type = message.message_type
+        self.last_message_preview = self.preview_for(message)
+        self.last_activity_at = message.sent_at or datetime.utcnow()
+        
+        # Increment in SQL so concurrent senders don't lose updates
+        column = self._unread_column(message.receiver_id)
+        setattr(self, column.key, column + 1)
+    
+    def mark_read(self, reader_id, up_to_id=None):
+        """Reset the unread counter of the reading side after a read up to up_to_id"""
+        column = self._unread_column(reader_id)
+        if up_to_id is None or self.last_message_id is None or up_to_id >= self.last_message_id:
+            setattr(self, column.key, 0)
+            return
+        # Newer messages arrived past the read cursor; count what is still unread
+        setattr(self, column.key, Message.query.filter(
+            Message.sender_id == (self.user2_id if reader_id == self.user1_id else self.user1_id),
+            Message.receiver_id == reader_id,
+            Message.is_read == False,
+            Message.is_deleted == False
+        ).count())
+    
+    def refresh(self):
+        """Recompute the summary from the messages table (backfill and deletes)"""
+        pair = or_(
+            and_(Message.sender_id == self.user1_id, Message.receiver_id == self.user2_id),
+            and_(Message.sender_id == self.user2_id, Message.receiver_id == self.user1_id)
+        )
+        last_message = Message.query.filter(pair, Message.is_deleted == False) \
+            .order_by(Message.sent_at.desc(), Message.id.desc()).first()
+        
+        self.last_message = last_message
+        self.last_sender_id = last_message.sender_id if last_message else None
+        self.last_message_type = last_message.message_type if last_message else None
+        self.last_message_preview = self.preview_for(last_message) if last_message else None
+        self.last_activity_at = last_message.sent_at if last_message else None
+        
+        unread = dict(db.session.query(Message.receiver_id, func.count(Message.id)).filter(
+            pair,
+            Message.is_read == False,
+            Message.is_deleted == False
+        ).group_by(Message.receiver_id).all())
+        self.unread_count_user1 = unread.get(self.user1_id, 0)
+        self.unread_count_user2 = unread.get(self.user2_id, 0)
+    
+    def __repr__(self):
+        return f'<ConversationSummary {self.user1_id} <-> {self.user2_id}>'
+
+
+class DiscoveryQueueEntry(db.Model):
+    """Precomputed, ranked discovery candidate for a user"""
+    __tablename__ = 'discovery_queue_entries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, index=True)
+    position = db.Column(db.Integer, nullable=False)  # Lower is shown first
+    score = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_discovery_queue_user_position', 'user_id', 'position'),)
+    
+    def __repr__(self):
+        return f'<DiscoveryQueueEntry {self.user_id} -> {self.candidate_id} @{self.position}>'
+
+
+class SeenSet(db.Model):
+    """Every profile a user has liked or passed, as one compact row per user.
+
+    The ids are kept as a sorted uint32 array, delta-encoded and zlib-compressed,
+    so tens of thousands of swipes cost a few KB and discovery can exclude them
+    with a single vectorized ``np.isin`` instead of an ``IN`` clause.
+    """
+    __tablename__ = 'seen_sets'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False, default=b'')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @staticmethod
+    def encode(ids):
+        """Sorted unique uint32 ids -> compressed delta bytes"""
+        if not len(ids):
+            return b''
+        return zlib.compress(np.diff(ids, prepend=np.uint32(0)).astype('<u4').tobytes())
+    
+    @staticmethod
+    def decode(data):
+        """Compressed delta bytes -> sorted uint32 ids"""
+        if not data:
+            return np.empty(0, dtype=np.uint32)
+        return np.cumsum(np.frombuffer(zlib.decompress(data), dtype='<u4'), dtype=np.uint32)
+    
+    @classmethod
+    def ids_for(cls, user_id):
+        """Sorted array of the ids user_id has already swiped on"""
+        data = db.session.execute(
+            db.select(cls.data).where(cls.user_id == user_id)
+        ).scalar()
+        return cls.decode(data)
+    
+    @classmethod
+    def record(cls, user_id, *seen_ids):
+        """Add ids to user_id's seen-set inside the caller's transaction.
+
+        Two swipes from one user (two tabs, two workers) can race: the row is
+        created with ON CONFLICT DO NOTHING, and the blob is replaced with a
+        compare-and-set on count, which only ever grows, re-reading on conflict.
+        """
+        insert_ignoring = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}[
+            db.session.get_bind().dialect.name
+        ]
+        db.session.execute(
+            insert_ignoring(cls).values(user_id=user_id, data=b'', count=0)
+            .on_conflict_do_nothing(index_elements=['user_id'])
+        )
+        new_ids = np.asarray(seen_ids, dtype=np.uint32)
+        while True:
+            data, count = db.session.execute(
+                select(cls.data, cls.count).where(cls.user_id == user_id)
+            ).one()
+            merged = np.union1d(cls.decode(data), new_ids)
+            if len(merged) == count:
+                return count
+            # Another swipe committed since the read: zero rows, read again
+            swapped = db.session.execute(
+                update(cls).where(cls.user_id == user_id, cls.count == count)
+                .values(data=cls.encode(merged), count=len(merged))
+            )
+            if swapped.rowcount:
+                return len(merged)
+    
+    def __repr__(self):
+        return f'<SeenSet {self.user_id} ({self.count})>'
+
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
     
@@ -245,10 +566,108 @@ class Notification(db.Model):
     
     related_user = db.relationship('User', foreign_keys=[related_user_id])
     
+    __table_args__ = (db.Index('ix_notifications_user_read', 'user_id', 'is_read'),)
+    
+    @classmethod
+    def mark_read(cls, user_id, up_to_id):
+        """Mark user_id's notifications up to up_to_id as read in one UPDATE"""
+        marked = db.session.execute(
+            update(cls).where(
+                cls.user_id == user_id,
+                cls.is_read == False,
+                cls.id <= up_to_id
+            ).values(is_read=True)
+        ).rowcount
+        UnreadCounter.adjust(db.session, user_id, notifications=-marked)
+        return marked
+    
     def __repr__(self):
         return f'<Notification {self.type} for {self.user_id}>'
 
 
+class UnreadCounter(db.Model):
+    """Unread message and notification totals behind the navbar badges.
+
+    Bumped in the same transaction as every Message/Notification insert and
+    lowered by the mark-read paths, so rendering a badge is one primary-key read.
+    ``reconcile`` recomputes them from the source tables to repair any drift.
+    """
+    __tablename__ = 'unread_counters'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    messages = db.Column(db.Integer, nullable=False, default=0)
+    notifications = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def for_user(cls, user_id):
+        """(messages, notifications) unread by user_id"""
+        row = db.session.execute(
+            select(cls.messages, cls.notifications).where(cls.user_id == user_id)
+        ).first()
+        return tuple(row) if row else (0, 0)
+    
+    @classmethod
+    def adjust(cls, connection, user_id, messages=0, notifications=0):
+        """Add the deltas to user_id's counters, never going below zero"""
+        if not messages and not notifications:
+            return
+        table = cls.__table__
+        result = connection.execute(update(table).where(table.c.user_id == user_id).values(
+            messages=case((table.c.messages + messages > 0, table.c.messages + messages), else_=0),
+            notifications=case((table.c.notifications + notifications > 0, table.c.notifications + notifications), else_=0)
+        ))
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(
+                user_id=user_id, messages=max(messages, 0), notifications=max(notifications, 0)
+            ))
+    
+    @classmethod
+    def reconcile(cls):
+        """Recompute every counter from messages and notifications; returns rows repaired"""
+        actual = {}
+        for user_id, count in db.session.execute(
+            select(Message.receiver_id, func.count()).where(Message.is_read == False)
+            .group_by(Message.receiver_id)
+        ):
+            actual[user_id] = [count, 0]
+        for user_id, count in db.session.execute(
+            select(Notification.user_id, func.count()).where(Notification.is_read == False)
+            .group_by(Notification.user_id)
+        ):
+            actual.setdefault(user_id, [0, 0])[1] = count
+        
+        stored = {user_id: (messages, notifications) for user_id, messages, notifications
+                  in db.session.execute(select(cls.user_id, cls.messages, cls.notifications))}
+        
+        repaired = 0
+        for user_id in actual.keys() | stored.keys():
+            messages, notifications = actual.get(user_id, (0, 0))
+            if user_id not in stored:
+                db.session.add(cls(user_id=user_id, messages=messages, notifications=notifications))
+            elif stored[user_id] != (messages, notifications):
+                db.session.execute(update(cls).where(cls.user_id == user_id).values(
+                    messages=messages, notifications=notifications
+                ))
+            else:
+                continue
+            repaired += 1
+        db.session.commit()
+        return repaired
+    
+    def __repr__(self):
+        return f'<UnreadCounter {self.user_id}: {self.messages}/{self.notifications}>'
+
+
+@event.listens_for(Message, 'after_insert')
+def _count_unread_message(mapper, connection, message):
+    UnreadCounter.adjust(connection, message.receiver_id, messages=1)
+
+
+@event.listens_for(Notification, 'after_insert')
+def _count_unread_notification(mapper, connection, notification):
+    UnreadCounter.adjust(connection, notification.user_id, notifications=1)
+
+
 class Report(db.Model):
     __tablename__ = 'reports'
     
@@ -360,4 +779,41 @@ class ProfileInsight(db.Model):
     user = db.relationship('User', backref='profile_insights')
     
     def __repr__(self):
-        return f'<ProfileInsight for {self.user_id}: Score {self.profile_score}>'
\ No newline at end of file
+        return f'<ProfileInsight for {self.user_id}: Score {self.profile_score}>'
+
+
+class AIResultCacheEntry(db.Model):
+    """Generated AI results keyed by a hash of feature, model, parameters and profile fingerprints"""
+    __tablename__ = 'ai_result_cache'
+    
+    key = db.Column(db.String(64), primary_key=True)  # sha256 hex
+    feature = db.Column(db.String(40), nullable=False)
+    result = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AIResultCacheEntry {self.feature} {self.key[:12]}>'
+
+
+class AIJob(db.Model):
+    """Background AI generation, persisted so queued work survives restarts"""
+    __tablename__ = 'ai_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)  # conversation_starters, compatibility
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    other_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    priority = db.Column(db.Integer, default=0, nullable=False)  # higher runs first
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(db.DateTime)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_ai_jobs_claim', 'status', 'priority', 'run_after'),
+    )
+    
+    def __repr__(self):
+        return f'<AIJob {self.kind} {self.user_id} -> {self.other_id} {self.status}>'
@@ -0,0 +1,300 @@
+"""
+Tiered content moderation
+Tier 1 runs in process: an Aho-Corasick automaton finds every listed phrase
+in one pass over normalized text, and a few regexes catch links, contact
+details and repeated text. Content with no flags is settled there as safe,
+which is nearly all of it. Flagged content is queued for tier 2, where a
+background task packs up to MODERATION_BATCH_SIZE items into one Groq prompt.
+At most MODERATION_QUEUE_LIMIT items wait; past that, flagged content is
+settled at once with its local flags.
+
+Every verdict, from either tier, is buffered and written to
+content_moderations with one executemany INSERT per pass.
+"""
+import hashlib
+import json
+import re
+import string
+import threading
+import time
+from collections import OrderedDict, deque
+
+from sqlalchemy import insert
+
+from app import socketio
+from app.models import db, ContentModeration
+from app.groq_service import groq_service
+
+# Phrases that send content to tier 2, by issue. Matched on whole words after
+# normalize(), so 'kik' doesn't fire inside 'kicked'.
+LEXICON = {
+    'scam': ('send money', 'wire transfer', 'western union', 'moneygram', 'gift card',
+             'bitcoin', 'crypto investment', 'investment opportunity', 'guaranteed return',
+             'cash app', 'cashapp', 'venmo me', 'paypal me', 'bank account', 'loan me',
+             'forex', 'sugar daddy'),
+    'off_platform_contact': ('whatsapp', 'telegram', 'snapchat', 'kik', 'wechat',
+                             'text me at', 'call me at', 'my number is', 'add me on'),
+    'sexual_content': ('nudes', 'send pics', 'sext', 'onlyfans', 'nsfw', 'hookup'),
+    'harassment': ('kill yourself', 'kys', 'idiot', 'stupid', 'loser', 'ugly',
+                   'bitch', 'slut', 'whore', 'shut up'),
+    'threat': ('i will find you', 'i know where you live', 'hurt you'),
+    'personal_information': ('home address', 'my address', 'social security', 'ssn',
+                             'credit card', 'password is'),
+}
+
+# One translate() pass: lowercase, undo common digit/symbol swaps, other ASCII punctuation to spaces
+_FOLD = {code: ' ' for code in range(128) if not chr(code).isalnum()}
+_FOLD.update({ord(upper): upper.lower() for upper in string.ascii_uppercase})
+_FOLD.update(str.maketrans('013457@$', 'oieastas'))
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+# Each pattern starts from a literal or a narrow class, so the regex engine can skip ahead
+_LINK = re.compile(r'://|www\.|(?<=[a-z0-9-])\.(?:com|net|org|io|me|ly|gg|co|xyz|link|app)\b', re.I)
+_EMAIL = re.compile(r'(?<=[\w.+-])@[\w-]+\.\w')
+_PHONE = re.compile(r'\d(?:[\s().-]{0,2}\d){8,}')
+_CHAR_RUN = re.compile(r'(\S)\1{7,}')
+
+
+def normalize(text):
+    """Lowercase, undo common digit/symbol swaps, words separated by single spaces, padded"""
+    text = text.translate(_FOLD)
+    if not text.isascii():
+        text = _NON_WORD.sub(' ', text.lower())
+    return ' ' + ' '.join(text.split()) + ' '
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton: every phrase occurrence in one pass over the text"""
+
+    def __init__(self, phrases):
+        self._goto = [{}]  # node -> {char: node}
+        self._fail = [0]
+        self._out = [()]  # node -> ((phrase, label), ...) ending here
+        for phrase, label in phrases:
+            node = 0
+            for ch in phrase:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] += ((phrase, label),)
+
+        # Failure links, breadth first so shorter suffixes are ready first
+        queue = deque(self._goto[0].values())
+        order = list(queue)  # breadth-first
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+                order.append(nxt)
+
+        # Fold failure links into full transition tables, so find() takes one
+        # dict lookup per character; characters in no phrase lead back to the root
+        alphabet = {ch for edges in self._goto for ch in edges}
+        self._delta = [dict(self._goto[0])]
+        self._delta.extend({} for _ in range(len(self._goto) - 1))
+        for node in order:
+            fallback = self._delta[self._fail[node]]
+            self._delta[node] = {ch: self._goto[node].get(ch, fallback.get(ch, 0)) for ch in alphabet}
+
+    def find(self, text):
+        """(phrase, label) for every match, in order of where they end"""
+        delta, out = self._delta, self._out
+        node = 0
+        hits = []
+        for ch in text:
+            node = delta[node].get(ch, 0)
+            if out[node]:
+                hits.extend(out[node])
+        return hits
+
+
+class _Review:
+    """Content waiting for tier 2; done is set once verdict is filled in"""
+    __slots__ = ('content_type', 'content_id', 'user_id', 'content', 'issues', 'verdict', 'done')
+
+    def __init__(self, content_type, content_id, user_id, content, issues):
+        self.content_type = content_type
+        self.content_id = content_id
+        self.user_id = user_id
+        self.content = content
+        self.issues = issues
+        self.verdict = None
+        self.done = threading.Event()
+
+
+def _verdict(is_safe, risk_level, issues, suggested_action, reason):
+    return {'is_safe': is_safe, 'risk_level': risk_level, 'issues': issues,
+            'suggested_action': suggested_action, 'reason': reason}
+
+
+class ModerationService:
+    def __init__(self):
+        self.app = None
+        # Padding with spaces makes every phrase match on word boundaries only
+        self.matcher = PhraseMatcher(
+            (f' {phrase} ', issue) for issue, phrases in LEXICON.items() for phrase in phrases
+        )
+        self._queue = deque()  # _Review awaiting tier 2
+        self._records = []  # content_moderations rows not yet written
+        self._repeats = OrderedDict()  # (user_id, content digest) -> times seen
+        self._running = 0
+        self._lock = threading.Lock()
+        self._worker_started = False
+
+    def init_app(self, app):
+        self.app = app
+
+    def screen(self, content):
+        """Tier 1: issues found locally; an empty list means the content is settled as safe"""
+        issues = []
+        for phrase, issue in self.matcher.find(normalize(content)):
+            if issue not in issues:
+                issues.append(issue)
+        if _LINK.search(content):
+            issues.append('link')
+        if _EMAIL.search(content) or _PHONE.search(content):
+            issues.append('contact_info')
+        if _CHAR_RUN.search(content):
+            issues.append('repeated_text')
+        return issues
+
+    def submit(self, content_type, content_id, user_id, content):
+        """Moderate content in the background; returns the verdict if tier 1 settled it, else None"""
+        review = self._screen(content_type, content_id, user_id, content)
+        return review.verdict
+
+    def moderate(self, content_type, user_id, content, content_id=None):
+        """Verdict for content, waiting for its tier 2 batch if it needs one"""
+        review = self._screen(content_type, content_id, user_id, content)
+        # Poll with socketio.sleep rather than blocking in done.wait(): on an
+        # unpatched eventlet hub that would stall the worker that sets it
+        deadline = time.monotonic() + self.app.config['MODERATION_WAIT_TIMEOUT']
+        while not review.done.is_set():
+            if time.monotonic() >= deadline:
+                # Still queued; it is recorded when its batch runs
+                return _verdict(True, 'medium', review.issues, 'warn',
+                                'Review pending; flagged by the local pre-filter')
+            socketio.sleep(self.app.config['MODERATION_WAIT_POLL'])
+        return review.verdict
+
+    def _screen(self, content_type, content_id, user_id, content):
+        issues = self.screen(content)
+        if self._is_repeat(user_id, content) and 'repeated_text' not in issues:
+            issues.append('repeated_text')
+        review = _Review(content_type, content_id, user_id, content, issues)
+        with self._lock:
+            if issues and len(self._queue) >= self.app.config['MODERATION_QUEUE_LIMIT']:
+                # Tier 2 is this far behind; fail open with the local flags, as review() does on error
+                review.verdict = _verdict(True, 'medium', issues, 'warn',
+                                          'Review queue full; flagged by the local pre-filter')
+                review.done.set()
+                self._records.append(self._record(review))
+            elif issues:
+                self._queue.append(review)
+            else:
+                review.verdict = _verdict(True, 'low', [], 'allow', 'No issues found by the local pre-filter')
+                review.done.set()
+                self._records.append(self._record(review))
+            start = not self._worker_started
+            self._worker_started = True
+        if start:
+            socketio.start_background_task(self._worker)
+        return review
+
+    def _is_repeat(self, user_id, content):
+        """True once a user has sent the same text MODERATION_REPEAT_THRESHOLD times recently"""
+        key = (user_id, hashlib.blake2b(normalize(content).encode(), digest_size=8).digest())
+        with self._lock:
+            count = self._repeats.pop(key, 0) + 1
+            self._repeats[key] = count
+            while len(self._repeats) > self.app.config['MODERATION_REPEAT_WINDOW']:
+                self._repeats.popitem(last=False)
+        return count >= self.app.config['MODERATION_REPEAT_THRESHOLD']
+
+    @staticmethod
+    def _record(review):
+        verdict = review.verdict
+        return {
+            'content_type': review.content_type,
+            'content_id': review.content_id,
+            'user_id': review.user_id,
+            'is_safe': bool(verdict.get('is_safe', True)),
+            'risk_level': verdict.get('risk_level'),
+            'issues': json.dumps(list(verdict.get('issues') or [])),
+            'suggested_action': verdict.get('suggested_action'),
+            'reason': verdict.get('reason'),
+        }
+
+    def review(self, batch):
+        """Tier 2: one Groq call for the whole batch; fills in each review's verdict"""
+        try:
+            verdicts = groq_service.moderate_batch([(r.content_type, r.content) for r in batch])
+        except Exception as e:
+            self.app.logger.error(f"Moderation batch of {len(batch)} failed: {str(e)}")
+            verdicts = [None] * len(batch)
+
+        with self._lock:
+            for review, verdict in zip(batch, verdicts):
+                # Fail open, as single-item moderation does, but keep the local flags
+                review.verdict = verdict or _verdict(
+                    True, 'medium', review.issues, 'warn',
+                    'Moderation service unavailable; flagged by the local pre-filter'
+                )
+                self._records.append(self._record(review))
+        for review in batch:
+            review.done.set()
+
+    def flush(self):
+        """Write every buffered verdict in one executemany INSERT"""
+        with self._lock:
+            records, self._records = self._records, []
+        if not records:
+            return 0
+        try:
+            db.session.execute(insert(ContentModeration), records)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._records[:0] = records
+            raise
+        return len(records)
+
+    def _review_task(self, batch):
+        try:
+            with self.app.app_context():
+                self.review(batch)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _worker(self):
+        while True:
+            socketio.sleep(self.app.config['MODERATION_BATCH_INTERVAL'])
+            size = self.app.config['MODERATION_BATCH_SIZE']
+            batches = []
+            with self._lock:
+                while self._queue and self._running < self.app.config['MODERATION_CONCURRENCY']:
+                    batches.append([self._queue.popleft() for _ in range(min(size, len(self._queue)))])
+                    self._running += 1
+            for batch in batches:
+                socketio.start_background_task(self._review_task, batch)
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception as e:
+                    self.app.logger.error(f"Moderation verdict flush failed: {str(e)}")
+
+
+# Global instance
+moderation = ModerationService()
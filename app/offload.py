@@ -0,0 +1,98 @@
+"""
+Blocking work off the event loop
+NativePool runs blocking calls (KDFs, HTTP calls to LLM APIs) on eventlet's
+native thread pool with a cap on how many run at once; outside eventlet it
+calls inline. SingleFlight lets concurrent callers asking for the same key
+share one execution.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class PoolBusy(Exception):
+    """No slot freed up within the queue timeout"""
+
+
+class NativePool:
+    def __init__(self, size=4):
+        self._tpool = None
+        self._slots = threading.BoundedSemaphore(size)
+
+    def configure(self, size, offload=True):
+        """Call from init_app, after eventlet has patched threading, so waiters are green"""
+        self._slots = threading.BoundedSemaphore(size)
+        self._tpool = None
+        if not offload:
+            return
+        try:
+            from eventlet import patcher, tpool
+        except ImportError:
+            return
+        if patcher.is_monkey_patched('thread'):
+            self._tpool = tpool
+
+    def run(self, fn, *args, queue_timeout=None, **kwargs):
+        """Call fn on a native thread under eventlet, inline otherwise"""
+        if self._tpool is None:
+            return fn(*args, **kwargs)
+        with self.slot(queue_timeout):
+            return self._tpool.execute(fn, *args, **kwargs)
+
+    @contextmanager
+    def slot(self, queue_timeout=None):
+        """Hold one unit of concurrency, e.g. for a whole streamed response"""
+        if self._tpool is None:
+            yield
+            return
+        if not self._slots.acquire(timeout=queue_timeout):
+            raise PoolBusy(f'no free slot within {queue_timeout}s')
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def execute(self, fn, *args, **kwargs):
+        """Call fn on a native thread without taking a slot; use inside slot()"""
+        if self._tpool is None:
+            return fn(*args, **kwargs)
+        return self._tpool.execute(fn, *args, **kwargs)
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}  # key -> _Flight in progress
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn once per key at a time; concurrent callers get the leader's result or error"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
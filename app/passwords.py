@@ -0,0 +1,46 @@
+"""
+Password hashing off the event loop
+Hashing and checking passwords run a deliberately slow KDF. Under eventlet they
+are handed to eventlet's native thread pool (hashlib releases the GIL while it
+works), with at most PASSWORD_HASH_CONCURRENCY in flight so a login burst
+queues instead of exhausting the pool. Hashes made with older parameters are
+flagged for a transparent rehash on the next successful login.
+"""
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.offload import NativePool
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.method = 'scrypt'
+        self.salt_length = 16
+        self._current = None  # method prefix new hashes carry, e.g. 'scrypt:32768:8:1'
+        self._pool = NativePool()
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.salt_length = app.config['PASSWORD_HASH_SALT_LENGTH']
+        self._current = None
+        self._pool.configure(app.config['PASSWORD_HASH_CONCURRENCY'],
+                             offload=app.config['PASSWORD_HASH_OFFLOAD'])
+
+    def hash(self, password):
+        return self._pool.run(generate_password_hash, password,
+                              method=self.method, salt_length=self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._pool.run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True when pwhash was made with a method or salt length other than the configured one"""
+        if self._current is None:
+            # werkzeug expands defaults ('scrypt' -> 'scrypt:32768:8:1'); learn the full prefix once
+            self._current = self.hash('').split('$', 1)[0]
+        method, _, rest = pwhash.partition('$')
+        salt = rest.partition('$')[0]
+        return method != self._current or len(salt) != self.salt_length
+
+
+# Global instance
+password_hasher = PasswordHasher()
@@ -0,0 +1,180 @@
+"""
+Socket presence registry
+Tracks every connected socket id per user so several tabs and devices can be
+online at once. Sockets refresh themselves with heartbeats and expire when they
+stop. A Redis store shares presence between workers; the local store covers a
+single process.
+"""
+import threading
+import time
+
+from app import socketio
+
+
+class LocalPresenceStore:
+    """Presence for one process: {user_id: {sid: expires_at}} behind a lock"""
+
+    def __init__(self):
+        self._sockets = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id, sid, ttl):
+        with self._lock:
+            sids = self._sockets.setdefault(user_id, {})
+            first = not sids
+            sids[sid] = time.monotonic() + ttl
+            return first
+
+    def remove(self, user_id, sid):
+        with self._lock:
+            sids = self._sockets.get(user_id)
+            if not sids or sids.pop(sid, None) is None:
+                return False
+            if not sids:
+                del self._sockets[user_id]
+                return True
+            return False
+
+    def touch(self, user_id, sid, ttl):
+        with self._lock:
+            sids = self._sockets.get(user_id)
+            if sids is not None and sid in sids:
+                sids[sid] = time.monotonic() + ttl
+
+    def is_online(self, user_id):
+        return user_id in self._sockets
+
+    def sids(self, user_id):
+        with self._lock:
+            return set(self._sockets.get(user_id, ()))
+
+    def expire(self):
+        """Drop sockets whose heartbeat lapsed; returns users who went offline"""
+        now = time.monotonic()
+        offline = []
+        with self._lock:
+            for user_id in list(self._sockets):
+                sids = self._sockets[user_id]
+                for sid in [sid for sid, expires_at in sids.items() if expires_at < now]:
+                    del sids[sid]
+                if not sids:
+                    del self._sockets[user_id]
+                    offline.append(user_id)
+        return offline
+
+
+class RedisPresenceStore:
+    """Presence shared by every worker: one hash per user, sid -> expiry time.
+
+    The hash key itself carries a TTL refreshed by each heartbeat, so a user
+    whose sockets all died disappears without a sweep.
+    """
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _key(user_id):
+        return f'presence:{user_id}'
+
+    def add(self, user_id, sid, ttl):
+        key = self._key(user_id)
+        pipe = self._redis.pipeline()
+        pipe.hlen(key)
+        pipe.hset(key, sid, time.time() + ttl)
+        pipe.expire(key, ttl)
+        was_online = pipe.execute()[0]
+        return not was_online
+
+    def remove(self, user_id, sid):
+        key = self._key(user_id)
+        pipe = self._redis.pipeline()
+        pipe.hdel(key, sid)
+        pipe.hlen(key)
+        removed, remaining = pipe.execute()
+        return bool(removed) and not remaining
+
+    def touch(self, user_id, sid, ttl):
+        key = self._key(user_id)
+        now = time.time()
+        stale = [other for other, expires_at in self._redis.hgetall(key).items()
+                 if float(expires_at) < now]
+        pipe = self._redis.pipeline()
+        if stale:
+            pipe.hdel(key, *stale)
+        pipe.hset(key, sid, now + ttl)
+        pipe.expire(key, ttl)
+        pipe.execute()
+
+    def is_online(self, user_id):
+        return bool(self._redis.exists(self._key(user_id)))
+
+    def sids(self, user_id):
+        return {sid.decode() for sid in self._redis.hkeys(self._key(user_id))}
+
+    def expire(self):
+        # Whole users expire through the key TTL; stale sids are pruned on the next heartbeat
+        return []
+
+
+class PresenceRegistry:
+    def __init__(self):
+        self.app = None
+        self.store = LocalPresenceStore()
+        self._offline_listeners = []
+        self._lock = threading.Lock()
+        self._worker_started = False
+
+    def init_app(self, app):
+        self.app = app
+        url = app.config.get('PRESENCE_REDIS_URL')
+        self.store = RedisPresenceStore(url) if url else LocalPresenceStore()
+
+    @property
+    def ttl(self):
+        return self.app.config['PRESENCE_TTL']
+
+    def on_offline(self, listener):
+        """Call listener(user_id) when a user's sockets all expire without disconnecting"""
+        self._offline_listeners.append(listener)
+
+    def connect(self, user_id, sid):
+        """Register a socket; True when it is the user's first (they came online)"""
+        self._start_expiry()
+        return self.store.add(user_id, sid, self.ttl)
+
+    def disconnect(self, user_id, sid):
+        """Forget a socket; True when it was the user's last (they went offline)"""
+        return self.store.remove(user_id, sid)
+
+    def heartbeat(self, user_id, sid):
+        self.store.touch(user_id, sid, self.ttl)
+
+    def is_online(self, user_id):
+        return self.store.is_online(user_id)
+
+    def sids(self, user_id):
+        return self.store.sids(user_id)
+
+    def _start_expiry(self):
+        with self._lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+        socketio.start_background_task(self._expiry_worker)
+
+    def _expiry_worker(self):
+        while True:
+            socketio.sleep(self.ttl / 3)
+            try:
+                for user_id in self.store.expire():
+                    self.app.logger.info(f"User {user_id} presence expired")
+                    for listener in self._offline_listeners:
+                        listener(user_id)
+            except Exception as e:
+                self.app.logger.error(f"Presence expiry failed: {str(e)}")
+
+
+# Global instance
+presence = PresenceRegistry()
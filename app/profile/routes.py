@@ -2,6 +2,10 @@ from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
 from app.forms import EditProfileForm, SettingsForm
+from app.search_index import search_index
+from app.identity_cache import identity_cache
+from app.social_graph import social_graph
+from app.moderation import moderation
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import os
@@ -20,6 +24,7 @@ def edit_profile():
     form = EditProfileForm()
     
     if form.validate_on_submit():
+        bio_changed = form.bio.data != current_user.profile.bio
         current_user.profile.bio = form.bio.data
         current_user.profile.current_role = form.current_role.data
         current_user.profile.experience_level = form.experience_level.data
@@ -38,7 +43,11 @@ def edit_profile():
         if form.country.data:
             current_user.country = form.country.data
         
+        search_index.index_user(current_user)
         db.session.commit()
+        identity_cache.invalidate(current_user.id)
+        if bio_changed and form.bio.data:
+            moderation.submit('bio', current_user.profile.id, current_user.id, form.bio.data)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile.my_profile'))
     
@@ -71,6 +80,7 @@ def settings():
         current_user.profile.profile_visibility = form.profile_visibility.data
         
         db.session.commit()
+        identity_cache.invalidate(current_user.id)
         flash('Settings updated successfully!', 'success')
         return redirect(url_for('profile.settings'))
     
@@ -111,6 +121,7 @@ def upload_photo():
         
         current_user.profile.profile_photo = filename
         db.session.commit()
+        identity_cache.invalidate(current_user.id)
         
         flash('Profile photo updated!', 'success')
     
@@ -133,6 +144,8 @@ def unblock_user(user_id):
     if current_user.has_blocked(user):
         current_user.blocked.remove(user)
         db.session.commit()
+        identity_cache.invalidate(current_user.id, user.id)
+        social_graph.remove_block(current_user.id, user.id)
         flash(f'You have unblocked {user.username}.', 'success')
     
     return redirect(url_for('profile.blocked_users'))
@@ -141,8 +154,11 @@ def unblock_user(user_id):
 @profile.route('/deactivate-account', methods=['POST'])
 @login_required
 def deactivate_account():
+    from app.discovery_queue import discovery_queue
     current_user.is_active = False
+    discovery_queue.drop_user(current_user.id)
     db.session.commit()
+    identity_cache.invalidate(current_user.id)
     
     from flask_login import logout_user
     logout_user()
@@ -0,0 +1,263 @@
+"""
+Candidate scoring engine for /discover
+Ranks a viewer's whole candidate pool in one vectorized pass over NumPy arrays
+"""
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+
+from app.models import db, User, Profile, user_interests, user_languages
+
+
+EXPERIENCE_LEVELS = ['Beginner', 'Intermediate', 'Advanced', 'Expert']
+LOOKING_FOR = ['Learning Partners', 'Mentors', 'Project Collaborators', 'Friends', 'All']
+COLLABORATION_INTERESTS = ['Open Source Projects', 'Study Groups', 'Pair Programming',
+                           'Code Reviews', 'Hackathons', 'All']
+
+# Age difference (in years) at which the age component drops to zero
+AGE_BAND_YEARS = 10
+
+DEFAULT_WEIGHTS = {
+    'interests': 3.0,
+    'languages': 2.0,
+    'age': 1.5,
+    'looking_for': 1.0,
+    'experience': 1.0,
+    'collaboration': 1.0,
+}
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount_rows(bits):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount_rows(bits):
+        as_bytes = np.ascontiguousarray(bits).view(np.uint8).reshape(bits.shape[0], -1)
+        return _POPCOUNT_TABLE[as_bytes].sum(axis=1, dtype=np.int32)
+
+
+def _encode(value, choices):
+    """Index of value in choices, -1 when unknown"""
+    try:
+        return choices.index(value)
+    except ValueError:
+        return -1
+
+
+def _pack_memberships(pairs, row_of, n_rows):
+    """Pack (user_id, item_id) pairs into an (n_rows, words) uint64 bitset matrix"""
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    n_words = max(1, int(pairs[:, 1].max()) // 64 + 1) if len(pairs) else 1
+    bits = np.zeros((n_rows, n_words), dtype=np.uint64)
+    if len(pairs):
+        rows = row_of(pairs[:, 0])
+        known = rows >= 0
+        rows, items = rows[known], pairs[known, 1]
+        np.bitwise_or.at(bits, (rows, items // 64),
+                         np.left_shift(np.uint64(1), (items % 64).astype(np.uint64)))
+    return bits
+
+
+class CandidateSnapshot:
+    """Column-oriented features of every active user, indexed by row"""
+
+    def __init__(self, ids, dob, looking_for, experience, collaboration,
+                 interest_bits, language_bits):
+        order = np.argsort(ids, kind='stable')
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.dob = np.asarray(dob, dtype=np.int32)[order]
+        self.looking_for = np.asarray(looking_for, dtype=np.int8)[order]
+        self.experience = np.asarray(experience, dtype=np.int8)[order]
+        self.collaboration = np.asarray(collaboration, dtype=np.int8)[order]
+        self.interest_bits = interest_bits[order]
+        self.language_bits = language_bits[order]
+        self.interest_counts = _popcount_rows(self.interest_bits)
+        self.language_counts = _popcount_rows(self.language_bits)
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, users, interest_pairs, language_pairs):
+        """Build from plain tuples.
+
+        users: (id, date_of_birth, looking_for, experience_level, collaboration_interest)
+        interest_pairs / language_pairs: (user_id, interest_or_language_id)
+        """
+        n = len(users)
+        ids = np.fromiter((u[0] for u in users), dtype=np.int64, count=n)
+        dob = np.fromiter((u[1].toordinal() if u[1] else 0 for u in users), dtype=np.int32, count=n)
+        looking_for = np.fromiter((_encode(u[2], LOOKING_FOR) for u in users), dtype=np.int8, count=n)
+        experience = np.fromiter((_encode(u[3], EXPERIENCE_LEVELS) for u in users), dtype=np.int8, count=n)
+        collaboration = np.fromiter((_encode(u[4], COLLABORATION_INTERESTS) for u in users), dtype=np.int8, count=n)
+
+        # Bitsets are packed in the unsorted row order; __init__ reorders them with the rest
+        sorted_rows = np.argsort(ids, kind='stable')
+        sorted_ids = ids[sorted_rows]
+
+        def row_of(user_ids):
+            pos = np.searchsorted(sorted_ids, user_ids)
+            pos = np.minimum(pos, max(n - 1, 0))
+            found = (sorted_ids[pos] == user_ids) if n else np.zeros(len(user_ids), dtype=bool)
+            return np.where(found, sorted_rows[pos] if n else 0, -1)
+
+        return cls(ids, dob, looking_for, experience, collaboration,
+                   _pack_memberships(interest_pairs, row_of, n),
+                   _pack_memberships(language_pairs, row_of, n))
+
+    @classmethod
+    def load(cls):
+        """Read the features with three flat queries, no ORM objects"""
+        users = db.session.execute(
+            select(User.id, User.date_of_birth, User.looking_for,
+                   Profile.experience_level, Profile.collaboration_interest)
+            .outerjoin(Profile, Profile.user_id == User.id)
+            .where(User.is_active == True)
+        ).all()
+        interest_pairs = db.session.execute(
+            select(user_interests.c.user_id, user_interests.c.interest_id)
+        ).all()
+        language_pairs = db.session.execute(
+            select(user_languages.c.user_id, user_languages.c.language_id)
+        ).all()
+        return cls.from_rows(users, interest_pairs, language_pairs)
+
+    def row(self, user_id):
+        pos = int(np.searchsorted(self.ids, user_id))
+        if pos < len(self.ids) and self.ids[pos] == user_id:
+            return pos
+        return None
+
+
+def _jaccard(bits, counts, viewer_bits, viewer_count):
+    # Widen the viewer row to the candidate matrix width (ids may exceed either side)
+    width = max(bits.shape[1], viewer_bits.shape[0])
+    if bits.shape[1] < width:
+        bits = np.pad(bits, ((0, 0), (0, width - bits.shape[1])))
+    viewer_bits = np.pad(viewer_bits, (0, width - viewer_bits.shape[0]))
+    inter = _popcount_rows(bits & viewer_bits)
+    union = counts + viewer_count - inter
+    return np.divide(inter, union, out=np.zeros(len(inter), dtype=np.float32), where=union > 0)
+
+
+class CandidateScorer:
+    """Scores and ranks discovery candidates against a cached feature snapshot"""
+
+    def __init__(self, weights=None):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Drop the snapshot so the next ranking reloads features"""
+        self._snapshot = None
+
+    def snapshot(self):
+        """Current snapshot, reloaded when older than DISCOVERY_SNAPSHOT_TTL"""
+        ttl = current_app.config.get('DISCOVERY_SNAPSHOT_TTL', 300)
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.built_at > ttl:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or time.monotonic() - snapshot.built_at > ttl:
+                    snapshot = self._snapshot = CandidateSnapshot.load()
+        return snapshot
+
+    def _viewer_features(self, snapshot, user):
+        row = snapshot.row(user.id)
+        if row is not None:
+            return (snapshot.dob[row], snapshot.looking_for[row], snapshot.experience[row],
+                    snapshot.collaboration[row], snapshot.interest_bits[row],
+                    snapshot.interest_counts[row], snapshot.language_bits[row],
+                    snapshot.language_counts[row])
+
+        # Viewer isn't in the snapshot yet (new or reactivated account)
+        one = CandidateSnapshot.from_rows(
+            [(user.id, user.date_of_birth, user.looking_for,
+              user.profile.experience_level if user.profile else None,
+              user.profile.collaboration_interest if user.profile else None)],
+            [(user.id, i.id) for i in user.interests],
+            [(user.id, l.id) for l in user.languages]
+        )
+        return (one.dob[0], one.looking_for[0], one.experience[0], one.collaboration[0],
+                one.interest_bits[0], one.interest_counts[0], one.language_bits[0],
+                one.language_counts[0])
+
+    def score(self, snapshot, user):
+        """Score every row of the snapshot for this viewer"""
+        (dob, looking_for, experience, collaboration,
+         interest_bits, interest_count, language_bits, language_count) = self._viewer_features(snapshot, user)
+        w = self.weights
+
+        interests = _jaccard(snapshot.interest_bits, snapshot.interest_counts, interest_bits, interest_count)
+        languages = _jaccard(snapshot.language_bits, snapshot.language_counts, language_bits, language_count)
+
+        age_gap_years = np.abs(snapshot.dob - np.int32(dob)) / np.float32(365.25)
+        age = np.clip(1 - age_gap_years / AGE_BAND_YEARS, 0, 1)
+        if not dob:
+            age = np.zeros(len(snapshot), dtype=np.float32)
+
+        all_code = LOOKING_FOR.index('All')
+        looking = ((snapshot.looking_for == looking_for) |
+                   (snapshot.looking_for == all_code) |
+                   (looking_for == all_code)).astype(np.float32)
+
+        if experience < 0:
+            exp = np.full(len(snapshot), 0.5, dtype=np.float32)
+        elif looking_for == LOOKING_FOR.index('Mentors'):
+            # Mentor seekers prefer people further along than themselves
+            exp = np.clip((snapshot.experience - experience) / 3, 0, 1).astype(np.float32)
+        else:
+            exp = 1 - np.abs(snapshot.experience - experience) / np.float32(3)
+        exp = np.where(snapshot.experience < 0, 0.5, exp)
+
+        collab_all = COLLABORATION_INTERESTS.index('All')
+        collab = ((snapshot.collaboration == collaboration) |
+                  (snapshot.collaboration == collab_all) |
+                  (collaboration == collab_all)) & (snapshot.collaboration >= 0) & (collaboration >= 0)
+
+        return (w['interests'] * interests + w['languages'] * languages + w['age'] * age +
+                w['looking_for'] * looking + w['experience'] * exp +
+                w['collaboration'] * collab.astype(np.float32))
+
+    def rank(self, user, limit, exclude_ids=(), snapshot=None, born_between=None):
+        """(ids, scores) of the best ``limit`` candidates for user, highest score first.
+
+        born_between is an optional (earliest, latest) date_of_birth window from
+        ``birth_date_range``; candidates outside it are never returned.
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        if not len(snapshot) or limit <= 0:
+            return [], []
+
+        scores = self.score(snapshot, user).astype(np.float32)
+        exclude = np.fromiter(exclude_ids, dtype=np.int64) if not isinstance(exclude_ids, np.ndarray) else exclude_ids
+        excluded = np.isin(snapshot.ids, exclude) | (snapshot.ids == user.id)
+        if born_between is not None:
+            earliest, latest = born_between
+            if earliest is not None:
+                excluded |= snapshot.dob < earliest.toordinal()
+            if latest is not None:
+                excluded |= snapshot.dob > latest.toordinal()
+        scores[excluded] = -np.inf
+
+        eligible = int(len(scores) - excluded.sum())
+        k = min(limit, eligible)
+        if k <= 0:
+            return [], []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((snapshot.ids[top], -scores[top]))]
+        return snapshot.ids[top].tolist(), scores[top].tolist()
+
+    def top_candidates(self, user, limit, exclude_ids=(), snapshot=None):
+        """Ids of the best ``limit`` candidates for user, highest score first"""
+        return self.rank(user, limit, exclude_ids, snapshot)[0]
+
+
+# Global instance
+candidate_scorer = CandidateScorer()
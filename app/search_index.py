@@ -0,0 +1,98 @@
+"""
+Full-text profile search
+An SQLite FTS5 table over the searchable profile text, keyed by user id and
+kept in sync by the profile edit paths. /search ranks its matches with bm25.
+"""
+import re
+
+from sqlalchemy import text, column, table, literal_column
+
+from app.models import db
+
+
+# Column order matters: bm25() weights below are positional
+FIELDS = ('username', 'city', 'current_role', 'bio', 'learning_goals', 'can_teach')
+BM25_WEIGHTS = (4.0, 2.0, 3.0, 1.0, 1.0, 1.0)
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+profile_search = table('profile_search', column('rowid'), *(column(field) for field in FIELDS))
+
+
+class ProfileSearchIndex:
+    TABLE = 'profile_search'
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+
+    def init_app(self, app):
+        self.app = app
+        with app.app_context():
+            self.enabled = db.engine.dialect.name == 'sqlite'
+            if self.enabled:
+                self.create()
+
+    def create(self):
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.TABLE} USING fts5("
+            f"{', '.join(FIELDS)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+        db.session.commit()
+
+    # Writes, run inside the caller's transaction
+
+    def index_user(self, user):
+        """(Re)index one user's searchable text"""
+        if not self.enabled:
+            return
+        profile = user.profile
+        values = {
+            'rowid': user.id,
+            'username': user.username,
+            'city': user.city,
+            'current_role': profile.current_role if profile else None,
+            'bio': profile.bio if profile else None,
+            'learning_goals': profile.learning_goals if profile else None,
+            'can_teach': profile.can_teach if profile else None,
+        }
+        self.remove_user(user.id)
+        db.session.execute(text(
+            f"INSERT INTO {self.TABLE} (rowid, {', '.join(FIELDS)}) "
+            f"VALUES (:rowid, {', '.join(':' + field for field in FIELDS)})"
+        ), values)
+
+    def remove_user(self, user_id):
+        if self.enabled:
+            db.session.execute(text(f"DELETE FROM {self.TABLE} WHERE rowid = :rowid"), {'rowid': user_id})
+
+    def rebuild(self, users):
+        """Reindex every given user (backfill)"""
+        for user in users:
+            self.index_user(user)
+
+    # Queries
+
+    @staticmethod
+    def match_expression(terms):
+        """FTS5 MATCH string from {field or None: user text}, every token a quoted prefix"""
+        clauses = []
+        for field, value in terms.items():
+            tokens = _TOKEN.findall(value or '')
+            if not tokens:
+                continue
+            phrase = ' '.join(f'"{token}"*' for token in tokens)
+            clauses.append(f'{field} : ({phrase})' if field else f'({phrase})')
+        return ' AND '.join(clauses)
+
+    def matches(self, expression):
+        """Subquery of (user_id, rank) for an FTS5 MATCH expression, best rank lowest"""
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        return db.select(
+            profile_search.c.rowid.label('user_id'),
+            literal_column(f"bm25({self.TABLE}, {weights})").label('rank')
+        ).where(literal_column(self.TABLE).op('MATCH')(expression)).subquery()
+
+
+# Global instance
+search_index = ProfileSearchIndex()
@@ -0,0 +1,62 @@
+"""
+Batched WebRTC signaling
+Trickle ICE sends a burst of candidates per peer within a few milliseconds.
+Clients in batched mode send them as arrays; the server buffers them per
+(sender, receiver) pair for a short window and relays each buffer as one frame.
+"""
+import threading
+
+from app import socketio
+from app.message_events import user_room
+
+
+class IceCandidateBatcher:
+    def __init__(self):
+        self.app = None
+        self._buffers = {}  # (sender_id, receiver_id) -> [candidate, ...]
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+
+    @property
+    def window(self):
+        return self.app.config['SIGNALING_ICE_BATCH_WINDOW_MS'] / 1000
+
+    def add(self, sender_id, receiver_id, candidates):
+        """Queue candidates for receiver_id; the first one in a window schedules the flush"""
+        if not candidates:
+            return
+        if self.window <= 0:
+            self._emit(sender_id, receiver_id, list(candidates))
+            return
+
+        key = (sender_id, receiver_id)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is not None:
+                buffer.extend(candidates)
+                return
+            self._buffers[key] = list(candidates)
+        socketio.start_background_task(self._flush_later, key)
+
+    def flush(self, sender_id, receiver_id):
+        """Send whatever is buffered for the pair now (end of candidates)"""
+        with self._lock:
+            candidates = self._buffers.pop((sender_id, receiver_id), None)
+        if candidates:
+            self._emit(sender_id, receiver_id, candidates)
+
+    def _flush_later(self, key):
+        socketio.sleep(self.window)
+        self.flush(*key)
+
+    def _emit(self, sender_id, receiver_id, candidates):
+        socketio.emit('webrtc_ice_candidates', {
+            'sender_id': sender_id,
+            'candidates': candidates
+        }, to=user_room(receiver_id))
+
+
+# Global instance
+ice_batcher = IceCandidateBatcher()
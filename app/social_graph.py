@@ -0,0 +1,128 @@
+"""
+Social graph cache
+Likes and blocks per user, in both directions, as adjacency sets. A user's
+edges load with one UNION ALL query the first time they are asked about; after
+that has_liked / has_matched / has_blocked are set lookups. like_user and
+block/unblock write through after committing. A bounded LRU caps memory, and
+entries expire after SOCIAL_GRAPH_TTL so writes made on other workers show up.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import literal, select
+
+from app.models import db, Like, blocked_users
+
+LIKES, LIKED_BY, BLOCKS, BLOCKED_BY = range(4)
+
+
+class UserEdges:
+    __slots__ = ('likes', 'liked_by', 'blocks', 'blocked_by', 'expires_at')
+
+    def __init__(self, expires_at):
+        self.likes = set()
+        self.liked_by = set()
+        self.blocks = set()
+        self.blocked_by = set()
+        self.expires_at = expires_at
+
+
+class SocialGraph:
+    def __init__(self):
+        self.app = None
+        self._edges = OrderedDict()  # user_id -> UserEdges
+        self._versions = {}  # user_id -> version, bumped by every write touching the user
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+
+    def edges(self, user_id):
+        """UserEdges for user_id, loading them on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            edges = self._edges.get(user_id)
+            if edges is not None and edges.expires_at >= now:
+                self._edges.move_to_end(user_id)
+                return edges
+            version = self._versions.get(user_id, 0)
+
+        edges = self._load(user_id, now + self.app.config['SOCIAL_GRAPH_TTL'])
+        with self._lock:
+            # A write that raced the load may be missing from it; serve it once, don't keep it
+            if self._versions.get(user_id, 0) == version:
+                self._edges[user_id] = edges
+                self._edges.move_to_end(user_id)
+                while len(self._edges) > self.app.config['SOCIAL_GRAPH_SIZE']:
+                    self._edges.popitem(last=False)
+        return edges
+
+    @staticmethod
+    def _load(user_id, expires_at):
+        edges = UserEdges(expires_at)
+        targets = (edges.likes, edges.liked_by, edges.blocks, edges.blocked_by)
+        rows = db.session.execute(
+            select(literal(LIKES), Like.liked_id).where(Like.liker_id == user_id)
+            .union_all(
+                select(literal(LIKED_BY), Like.liker_id).where(Like.liked_id == user_id),
+                select(literal(BLOCKS), blocked_users.c.blocked_id).where(blocked_users.c.blocker_id == user_id),
+                select(literal(BLOCKED_BY), blocked_users.c.blocker_id).where(blocked_users.c.blocked_id == user_id),
+            )
+        )
+        for kind, other_id in rows:
+            targets[kind].add(other_id)
+        return edges
+
+    def has_liked(self, user_id, other_id):
+        return other_id in self.edges(user_id).likes
+
+    def has_matched(self, user_id, other_id):
+        edges = self.edges(user_id)
+        return other_id in edges.likes and other_id in edges.liked_by
+
+    def has_blocked(self, user_id, other_id):
+        return other_id in self.edges(user_id).blocks
+
+    def is_blocked_by(self, user_id, other_id):
+        return other_id in self.edges(user_id).blocked_by
+
+    def match_ids(self, user_id):
+        """Everyone user_id has a mutual like with"""
+        edges = self.edges(user_id)
+        with self._lock:
+            return edges.likes & edges.liked_by
+
+    def blocked_ids(self, user_id):
+        """Everyone user_id blocked or was blocked by"""
+        edges = self.edges(user_id)
+        with self._lock:
+            return edges.blocks | edges.blocked_by
+
+    def add_like(self, liker_id, liked_id):
+        self._write(liker_id, 'likes', liked_id, add=True)
+        self._write(liked_id, 'liked_by', liker_id, add=True)
+
+    def add_block(self, blocker_id, blocked_id):
+        self._write(blocker_id, 'blocks', blocked_id, add=True)
+        self._write(blocked_id, 'blocked_by', blocker_id, add=True)
+
+    def remove_block(self, blocker_id, blocked_id):
+        self._write(blocker_id, 'blocks', blocked_id, add=False)
+        self._write(blocked_id, 'blocked_by', blocker_id, add=False)
+
+    def _write(self, user_id, kind, other_id, add):
+        """Apply a committed change to user_id's cached edges, if they are cached"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            edges = self._edges.get(user_id)
+            if edges is None:
+                return
+            if add:
+                getattr(edges, kind).add(other_id)
+            else:
+                getattr(edges, kind).discard(other_id)
+
+
+# Global instance
+social_graph = SocialGraph()
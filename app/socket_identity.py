@@ -0,0 +1,35 @@
+"""
+Per-socket identity
+The user behind a Socket.IO connection is resolved once at connect and kept
+against the socket id until it disconnects, so event handlers never go back
+through Flask-Login's user_loader. A socket lives on one worker, so a
+per-process dict is enough.
+"""
+from collections import namedtuple
+
+from flask import request
+
+SocketIdentity = namedtuple('SocketIdentity', ['id', 'username', 'photo'])
+
+_identities = {}  # sid -> SocketIdentity
+
+
+def remember_identity(user):
+    """Store user's id, username and photo with the current socket"""
+    identity = SocketIdentity(
+        id=user.id,
+        username=user.username,
+        photo=user.profile.profile_photo if user.profile else None
+    )
+    _identities[request.sid] = identity
+    return identity
+
+
+def socket_identity():
+    """Identity stored at connect, or None for an unauthenticated socket"""
+    return _identities.get(request.sid)
+
+
+def forget_identity():
+    """Drop the current socket's identity; call on disconnect"""
+    return _identities.pop(request.sid, None)
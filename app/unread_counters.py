@@ -0,0 +1,50 @@
+"""
+Navbar unread badges
+Serves the per-user unread counters to templates and runs a background job
+that periodically reconciles them against messages and notifications.
+"""
+import threading
+
+from flask_login import current_user
+
+from app import socketio
+from app.models import db, UnreadCounter
+
+
+class UnreadBadges:
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._worker_started = False
+
+    def init_app(self, app):
+        self.app = app
+        app.context_processor(lambda: {'unread_counts': self.counts})
+
+    def counts(self):
+        """(messages, notifications) unread by the current user, one primary-key read"""
+        self.start_reconciler()
+        return UnreadCounter.for_user(current_user.id)
+
+    def start_reconciler(self):
+        with self._lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+        socketio.start_background_task(self._worker)
+
+    def _worker(self):
+        while True:
+            socketio.sleep(self.app.config['UNREAD_RECONCILE_INTERVAL'])
+            with self.app.app_context():
+                try:
+                    repaired = UnreadCounter.reconcile()
+                    if repaired:
+                        self.app.logger.info(f"Repaired {repaired} drifted unread counters")
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Unread counter reconciliation failed: {str(e)}")
+
+
+# Global instance
+unread_badges = UnreadBadges()
@@ -0,0 +1,64 @@
+"""
+Benchmark for the /discover candidate scorer
+
+Builds a synthetic feature snapshot and times ranking one viewer's whole pool.
+
+    python -m benchmarks.discover_scoring --users 100000
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from app.scoring import (CandidateScorer, CandidateSnapshot, COLLABORATION_INTERESTS,
+                         EXPERIENCE_LEVELS, LOOKING_FOR)
+
+
+def synthetic_snapshot(n_users, n_interests=10, n_languages=12, seed=42):
+    rng = random.Random(seed)
+    today = date.today()
+    users, interests, languages = [], [], []
+    for user_id in range(1, n_users + 1):
+        users.append((
+            user_id,
+            today - timedelta(days=rng.randint(18 * 365, 60 * 365)),
+            rng.choice(LOOKING_FOR),
+            rng.choice(EXPERIENCE_LEVELS + [None]),
+            rng.choice(COLLABORATION_INTERESTS + [None]),
+        ))
+        interests.extend((user_id, i) for i in rng.sample(range(1, n_interests + 1), rng.randint(0, 4)))
+        languages.extend((user_id, l) for l in rng.sample(range(1, n_languages + 1), rng.randint(0, 5)))
+    return CandidateSnapshot.from_rows(users, interests, languages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--excluded', type=int, default=5_000, help='ids excluded per viewer (likes, blocks)')
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    snapshot = synthetic_snapshot(args.users)
+    print(f'Built snapshot of {len(snapshot):,} users in {time.perf_counter() - started:.2f}s')
+
+    scorer = CandidateScorer()
+    rng = random.Random(7)
+    timings = []
+    for _ in range(args.rounds):
+        viewer = SimpleNamespace(id=rng.randint(1, args.users))
+        exclude = rng.sample(range(1, args.users + 1), min(args.excluded, args.users))
+        started = time.perf_counter()
+        scorer.top_candidates(viewer, args.limit, exclude, snapshot=snapshot)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    print(f'Ranked top {args.limit} over {args.users:,} candidates, {args.rounds} viewers')
+    print(f'  median {timings[len(timings) // 2] * 1000:.2f} ms   '
+          f'p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark for trickle ICE signaling, one event per candidate vs batched
+
+Runs the real app against a throwaway SQLite database, logs two users in and
+drives the Socket.IO handlers through Flask-SocketIO's local test client.
+
+    python -m benchmarks.ice_signaling --candidates 12 --gap-ms 5
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+
+from config import Config
+
+
+def candidate(i):
+    return {'candidate': f'candidate:{i} 1 udp 2122260223 192.0.2.{i % 250} {50000 + i} typ host',
+            'sdpMid': '0', 'sdpMLineIndex': 0}
+
+
+def make_clients(app, socketio):
+    from app.models import db, User, Profile
+
+    clients = []
+    with app.app_context():
+        for name in ('caller', 'callee'):
+            user = User(username=name, email=f'{name}@techbuddy.dev', gender='Other',
+                        date_of_birth=date(1995, 1, 1))
+            user.set_password('password')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Profile(user_id=user.id))
+        db.session.commit()
+        ids = {user.username: user.id for user in User.query.all()}
+
+    for name in ('caller', 'callee'):
+        http = app.test_client()
+        http.post('/auth/login', data={'email': f'{name}@techbuddy.dev', 'password': 'password'})
+        client = socketio.test_client(app, flask_test_client=http)
+        assert client.is_connected(), f'{name} socket was not authenticated'
+        client.get_received()
+        clients.append(client)
+    return clients, ids['callee']
+
+
+def wait_for(callee, socketio, expected, timeout=5):
+    """Collect ICE frames on the callee until `expected` candidates arrived"""
+    frames, received = 0, 0
+    deadline = time.perf_counter() + timeout
+    while received < expected and time.perf_counter() < deadline:
+        for packet in callee.get_received():
+            if packet['name'] == 'webrtc_ice_candidate':
+                frames, received = frames + 1, received + 1
+            elif packet['name'] == 'webrtc_ice_candidates':
+                frames, received = frames + 1, received + len(packet['args'][0]['candidates'])
+        if received < expected:
+            socketio.sleep(0.001)
+    return frames, received
+
+
+def call_setup(caller, callee, socketio, callee_id, n, gap, batched):
+    """Trickle n candidates `gap` seconds apart; time until the callee has them all"""
+    started = time.perf_counter()
+    for i in range(n):
+        if batched:
+            caller.emit('webrtc_ice_candidates', {'receiver_id': callee_id, 'candidates': [candidate(i)]})
+        else:
+            caller.emit('webrtc_ice_candidate', {'receiver_id': callee_id, 'candidate': candidate(i)})
+        socketio.sleep(gap)
+    if batched:
+        caller.emit('webrtc_ice_candidates', {'receiver_id': callee_id, 'candidates': [], 'complete': True})
+    frames, received = wait_for(callee, socketio, n)
+    return time.perf_counter() - started, frames, received
+
+
+def throughput(caller, callee, socketio, callee_id, n, batched, batch_size):
+    """Candidates relayed per second when the caller emits as fast as it can"""
+    started = time.perf_counter()
+    if batched:
+        for i in range(0, n, batch_size):
+            caller.emit('webrtc_ice_candidates', {
+                'receiver_id': callee_id,
+                'candidates': [candidate(j) for j in range(i, min(i + batch_size, n))]
+            })
+    else:
+        for i in range(n):
+            caller.emit('webrtc_ice_candidate', {'receiver_id': callee_id, 'candidate': candidate(i)})
+    frames, received = wait_for(callee, socketio, n, timeout=30)
+    elapsed = time.perf_counter() - started
+    return received / elapsed, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--candidates', type=int, default=12, help='candidates per call setup')
+    parser.add_argument('--gap-ms', type=float, default=5, help='delay between gathered candidates')
+    parser.add_argument('--window-ms', type=float, default=30, help='server batching window')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--throughput', type=int, default=5_000, help='candidates for the throughput run')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            WTF_CSRF_ENABLED = False
+            SIGNALING_ICE_BATCH_WINDOW_MS = args.window_ms
+
+        from app import create_app, socketio
+        app = create_app(BenchConfig)
+        (caller, callee), callee_id = make_clients(app, socketio)
+
+        for batched in (False, True):
+            mode = f'batched ({args.window_ms:g} ms window)' if batched else 'one event per candidate'
+            latencies, frame_counts = [], []
+            for _ in range(args.rounds):
+                elapsed, frames, received = call_setup(caller, callee, socketio, callee_id,
+                                                       args.candidates, args.gap_ms / 1000, batched)
+                assert received == args.candidates, f'lost candidates: {received}/{args.candidates}'
+                latencies.append(elapsed)
+                frame_counts.append(frames)
+            latencies.sort()
+            rate, frames = throughput(caller, callee, socketio, callee_id, args.throughput,
+                                      batched, args.candidates)
+
+            print(mode)
+            print(f'  call setup: median {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+                  f'{sum(frame_counts) / len(frame_counts):.1f} frames to the callee '
+                  f'for {args.candidates} candidates')
+            print(f'  throughput: {rate:,.0f} candidates/s in {frames:,} frames')
+
+        caller.disconnect()
+        callee.disconnect()
+
+
+if __name__ == '__main__':
+    main()
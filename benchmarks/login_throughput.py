@@ -0,0 +1,95 @@
+"""
+Benchmark for login throughput under concurrent signaling load
+
+Runs the real app under eventlet against a throwaway SQLite database. A pool of
+greenlets logs in through the test client while a signaling greenlet relays ICE
+batches between two sockets every few milliseconds and records how late the
+hub wakes it. Runs once with hashing inline on the hub and once offloaded.
+
+    python -m benchmarks.login_throughput --logins 100 --concurrency 20
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+
+from config import Config  # noqa: E402
+from benchmarks.ice_signaling import candidate, make_clients  # noqa: E402
+
+
+def login(app):
+    client = app.test_client()
+    response = client.post('/auth/login', data={'email': 'callee@techbuddy.dev', 'password': 'password'})
+    assert response.status_code == 302, f'login failed with {response.status_code}'
+
+
+def signaling_load(caller, callee_id, tick, stop, lags):
+    """Relay one ICE batch per tick; record how far past the tick the hub woke us"""
+    i = 0
+    while not stop.ready():
+        started = time.perf_counter()
+        eventlet.sleep(tick)
+        lags.append(time.perf_counter() - started - tick)
+        caller.emit('webrtc_ice_candidates', {'receiver_id': callee_id, 'candidates': [candidate(i)]})
+        i += 1
+
+
+def run(app, caller, callee, callee_id, logins, concurrency, tick):
+    lags = []
+    stop = eventlet.Event()
+    load = eventlet.spawn(signaling_load, caller, callee_id, tick, stop, lags)
+    eventlet.sleep(tick * 5)
+
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(concurrency)
+    for _ in pool.imap(lambda _: login(app), range(logins)):
+        pass
+    elapsed = time.perf_counter() - started
+
+    stop.send()
+    load.wait()
+    callee.get_received()
+    lags.sort()
+    return logins / elapsed, lags[len(lags) // 2], lags[int(len(lags) * 0.99)], lags[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=20, help='logins in flight at once')
+    parser.add_argument('--tick-ms', type=float, default=5, help='signaling relay interval')
+    parser.add_argument('--method', default=Config.PASSWORD_HASH_METHOD)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            WTF_CSRF_ENABLED = False
+            PASSWORD_HASH_METHOD = args.method
+            SIGNALING_LOG_LEVEL = 'OFF'
+
+        from app import create_app, socketio
+        from app.passwords import password_hasher
+        app = create_app(BenchConfig)
+        (caller, callee), callee_id = make_clients(app, socketio)
+
+        for offload in (False, True):
+            app.config['PASSWORD_HASH_OFFLOAD'] = offload
+            password_hasher.init_app(app)
+            rate, median, p99, worst = run(app, caller, callee, callee_id,
+                                           args.logins, args.concurrency, args.tick_ms / 1000)
+            mode = f'offloaded (at most {app.config["PASSWORD_HASH_CONCURRENCY"]} at once)' if offload else 'inline on the hub'
+            print(f'{args.method} hashing {mode}')
+            print(f'  logins: {rate:,.1f}/s')
+            print(f'  signaling lag: median {median * 1000:.1f} ms, '
+                  f'p99 {p99 * 1000:.1f} ms, worst {worst * 1000:.1f} ms')
+
+        caller.disconnect()
+        callee.disconnect()
+
+
+if __name__ == '__main__':
+    main()
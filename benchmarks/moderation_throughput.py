@@ -0,0 +1,134 @@
+"""
+Benchmark for tiered content moderation
+
+Tier 1 screens a synthetic message corpus in process and reports its rate and
+how much of the corpus it escalates. Tier 2 runs the real pipeline under
+eventlet against a throwaway SQLite database, pushing flagged items through
+Groq one per call and then in batches. Without --live, each Groq call sleeps
+for a latency model (fixed cost plus a per-item cost) and answers "safe".
+
+    python -m benchmarks.moderation_throughput --messages 100000 --flagged 500
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import random  # noqa: E402
+import re  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+from datetime import date  # noqa: E402
+
+from config import Config  # noqa: E402
+
+SAFE = [
+    "Hey! I saw you're into {topic} too. What are you building at the moment?",
+    "Haha that's a great point, I've been meaning to try {topic} for ages",
+    "Are you free this weekend? We could pair on that {topic} side project",
+    "I mostly write {topic} at work but I'd love to learn more about it",
+    "Just finished a talk on {topic}, the speaker was brilliant",
+    "Good morning! How did the interview go yesterday?",
+    "Coffee on Thursday sounds perfect, see you at 6",
+]
+FLAGGED = [
+    "add me on whatsapp, I'm never on this app",
+    "my number is +1 (555) 123-4567, text me",
+    "I have an investment opportunity in bitcoin with guaranteed returns",
+    "check out my profile at www.example-dating.xyz",
+    "you are so stupid lol",
+    "heyyyyyyyyyyyyyy",
+]
+TOPICS = ['Rust', 'machine learning', 'React', 'Kubernetes', 'game dev', 'Go', 'data viz']
+
+
+def corpus(n, flagged_share, seed=42):
+    rng = random.Random(seed)
+    return [rng.choice(FLAGGED) if rng.random() < flagged_share
+            else rng.choice(SAFE).format(topic=rng.choice(TOPICS))
+            for _ in range(n)]
+
+
+def bench_tier1(moderation, messages):
+    started = time.perf_counter()
+    escalated = sum(1 for text in messages if moderation.screen(text))
+    elapsed = time.perf_counter() - started
+    print(f'Tier 1: {len(messages):,} messages in {elapsed:.2f}s')
+    print(f'  {len(messages) / elapsed:,.0f} messages/s, {elapsed / len(messages) * 1e6:.1f} us each')
+    print(f'  escalated {escalated:,} ({escalated / len(messages):.1%})')
+
+
+def simulated_groq(base, per_item):
+    """Stand-in for GroqService._call_groq: sleeps like a remote call, answers safe"""
+    def call(prompt, system_message, temperature=0.7, max_tokens=1024):
+        ids = [int(i) for i in re.findall(r'^\[(\d+)\]', prompt, re.M)]
+        time.sleep(base + per_item * len(ids))
+        return json.dumps([{'id': i, 'is_safe': True, 'risk_level': 'low', 'issues': [],
+                            'suggested_action': 'allow', 'reason': 'ok'} for i in ids])
+    return call
+
+
+def bench_tier2(app, moderation, user_id, items, batch_size):
+    app.config['MODERATION_BATCH_SIZE'] = batch_size
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(len(items))
+    for _ in pool.imap(lambda text: moderation.moderate('message', user_id, text), items):
+        pass
+    elapsed = time.perf_counter() - started
+    with app.app_context():
+        moderation.flush()
+    print(f'  batch size {batch_size:>3}: {len(items) / elapsed:,.1f} items/s '
+          f'({elapsed:.2f}s for {len(items)}, {-(-len(items) // batch_size)} Groq calls)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--flagged-share', type=float, default=0.02, help='share of the tier 1 corpus that is not clean')
+    parser.add_argument('--flagged', type=int, default=200, help='items pushed through tier 2')
+    parser.add_argument('--batch-size', type=int, default=Config.MODERATION_BATCH_SIZE)
+    parser.add_argument('--latency-ms', type=float, default=400, help='simulated fixed cost per Groq call')
+    parser.add_argument('--per-item-ms', type=float, default=15, help='simulated extra cost per batched item')
+    parser.add_argument('--live', action='store_true', help='call Groq instead of the latency model')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            SIGNALING_LOG_LEVEL = 'OFF'
+            MODERATION_WAIT_TIMEOUT = 600
+            MODERATION_BATCH_INTERVAL = 0.05
+            # Distinct texts below; keep the repeat heuristic out of the measurement
+            MODERATION_REPEAT_THRESHOLD = 10 ** 9
+
+        from app import create_app, db
+        from app.groq_service import groq_service
+        from app.models import User, ContentModeration
+        from app.moderation import moderation
+        app = create_app(BenchConfig)
+
+        bench_tier1(moderation, corpus(args.messages, args.flagged_share))
+
+        with app.app_context():
+            user = User(username='bench', email='bench@techbuddy.dev', gender='Other',
+                        date_of_birth=date(1995, 1, 1), password_hash='-')
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+
+        if not args.live:
+            groq_service._call_groq = simulated_groq(args.latency_ms / 1000, args.per_item_ms / 1000)
+        rng = random.Random(7)
+        items = [f'{rng.choice(FLAGGED)} #{i}' for i in range(args.flagged)]
+        mode = 'live Groq' if args.live else f'{args.latency_ms:.0f} ms + {args.per_item_ms:.0f} ms/item simulated'
+        print(f'Tier 2: {args.flagged} flagged items, {app.config["MODERATION_CONCURRENCY"]} calls in flight ({mode})')
+        for batch_size in (1, args.batch_size):
+            bench_tier2(app, moderation, user_id, items, batch_size)
+
+        with app.app_context():
+            print(f'  verdicts written: {ContentModeration.query.count():,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -14,5 +14,6 @@ mkdir -p app/static/uploads/messages/voice
 # Run migrations
 python migrate_db.py
 python migrate_ai_tables.py
+python migrate_performance.py
 
 echo "Build completed successfully!"
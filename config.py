@@ -17,10 +17,81 @@ class Config:
     # Session config
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
+    # Identity cache for the Flask-Login user_loader (per worker)
+    IDENTITY_CACHE_SIZE = 4096  # Users kept, least recently used evicted first
+    IDENTITY_CACHE_TTL = 60  # Seconds; bounds staleness from edits made on other workers
+    
+    # Social graph cache: likes and blocks per user, both directions (per worker)
+    SOCIAL_GRAPH_SIZE = 20000  # Users kept, least recently used evicted first
+    SOCIAL_GRAPH_TTL = 60  # Seconds; bounds staleness from writes made on other workers
+    
+    # Password hashing: werkzeug method string, e.g. 'scrypt' or 'pbkdf2:sha256:600000'.
+    # Changing it rehashes each account on its next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_SALT_LENGTH = 16
+    PASSWORD_HASH_OFFLOAD = True  # Hash on eventlet's native thread pool instead of the hub
+    PASSWORD_HASH_CONCURRENCY = 4  # Hashes running at once on native threads under eventlet
+    
     # Pagination
     USERS_PER_PAGE = 20
     MESSAGES_PER_PAGE = 50
     
+    # Discovery ranking
+    DISCOVERY_SNAPSHOT_TTL = 300  # Seconds before candidate features are reloaded
+    DISCOVERY_QUEUE_SIZE = 200  # Candidates kept ranked per user
+    DISCOVERY_QUEUE_LOW_WATERMARK = 60  # Refill in the background below this
+    DISCOVERY_REFILL_INTERVAL = 1  # Seconds between background refill passes
+    
+    # Socket.IO scaling
+    # Pub/sub backend shared by every worker and node: redis://host:6379/0 for Redis
+    # or a compatible server (Valkey, KeyDB). Unset keeps routing in-process (one worker).
+    # Only Socket.IO emits go through it. These per-worker caches are not shared, so
+    # with several workers each one can serve stale data for a while:
+    # - identity_cache and social_graph: up to IDENTITY_CACHE_TTL / SOCIAL_GRAPH_TTL
+    # - discovery_queue: until the viewer's next refill
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    # Several workers have no sticky sessions, so clients skip long-polling
+    SOCKETIO_CLIENT_TRANSPORTS = ['websocket'] if SOCKETIO_MESSAGE_QUEUE else ['polling', 'websocket']
+    
+    # WebRTC signaling: batched clients send ICE candidates as arrays, which the
+    # server buffers per peer pair for this window and relays as one frame
+    SIGNALING_BATCH_ICE = True
+    SIGNALING_ICE_BATCH_WINDOW_MS = 30
+    
+    # Signaling event log: structured, sampled, written in batches to the 'signaling'
+    # logger (stderr, one JSON object per line). SIGNALING_LOG_LEVEL takes a logging
+    # level name or OFF and applies to that logger alone.
+    SIGNALING_LOG_LEVEL = os.environ.get('SIGNALING_LOG_LEVEL', 'INFO')
+    SIGNALING_LOG_SAMPLE = {  # Fraction of these chatty events kept
+        'heartbeat': 0.01,
+        'webrtc_ice_candidate': 0.05,
+        'webrtc_ice_candidates': 0.1,
+    }
+    SIGNALING_LOG_BUFFER = 1000  # Recent events kept for the admin dump
+    SIGNALING_LOG_FLUSH_INTERVAL = 2
+    
+    # Presence: sockets expire PRESENCE_TTL seconds after their last heartbeat
+    PRESENCE_TTL = 90
+    PRESENCE_REDIS_URL = os.environ.get('PRESENCE_REDIS_URL') or (
+        SOCKETIO_MESSAGE_QUEUE if (SOCKETIO_MESSAGE_QUEUE or '').startswith('redis') else None
+    )
+    
+    # Calls: unanswered calls ring out after CALL_RING_TIMEOUT seconds; active calls
+    # end once neither side's heartbeat has renewed them for CALL_LEASE seconds.
+    # Finished calls are written to the conversation in batches.
+    CALL_RING_TIMEOUT = 45
+    CALL_LEASE = PRESENCE_TTL
+    CALL_RECORD_FLUSH_INTERVAL = 5
+    CALL_REDIS_URL = os.environ.get('CALL_REDIS_URL') or PRESENCE_REDIS_URL
+    
+    # Activity tracking (last_seen is written behind, in batches)
+    ACTIVITY_FLUSH_INTERVAL = 5  # Seconds between batched last_seen writes
+    ACTIVITY_RESOLUTION = 60  # Skip writes closer than this to the last one
+    ACTIVITY_RECENT_WINDOW = 15 * 60  # Seconds a user counts as recently active
+    
+    # Navbar badges
+    UNREAD_RECONCILE_INTERVAL = 600  # Seconds between unread counter repair passes
+    
     # Age restriction
     MIN_AGE = 18
     MAX_AGE = 100
@@ -28,3 +99,28 @@ class Config:
     # Groq API config
     GROQ_API_KEY = os.environ.get('GROQ_API_KEY') or 'gsk_REPLACE_WITH_YOUR_KEY'
     GROQ_MODEL = 'llama-3.3-70b-versatile'  # Fast and powerful model
+    GROQ_TIMEOUT = 20  # Seconds per upstream request
+    GROQ_MAX_RETRIES = 1
+    GROQ_MAX_CONCURRENCY = 8  # Upstream calls in flight per worker
+    GROQ_QUEUE_TIMEOUT = 10  # Seconds to wait for a free slot before failing the request
+    
+    # AI result cache: in-memory LRU per worker, in front of the ai_result_cache table
+    AI_CACHE_SIZE = 1024
+    
+    # Background AI jobs: each new match queues starters and compatibility generation
+    AI_JOB_CONCURRENCY = 2  # Jobs running at once per worker, leaving Groq slots for requests
+    AI_JOB_POLL_INTERVAL = 1
+    AI_JOB_LEASE = 120  # Seconds before a running job's worker is presumed dead
+    AI_JOB_MAX_ATTEMPTS = 5
+    AI_JOB_RETRY_DELAY = 30  # Seconds, doubling with each attempt
+    
+    # Content moderation: a local pre-filter settles clean content; flagged items go
+    # to Groq in batches, and every verdict is written to content_moderations in bulk
+    MODERATION_BATCH_SIZE = 20
+    MODERATION_BATCH_INTERVAL = 0.5  # Seconds between batching passes
+    MODERATION_CONCURRENCY = 2  # Batches in flight per worker
+    MODERATION_QUEUE_LIMIT = 2000  # Flagged items waiting per worker; beyond it they fail open
+    MODERATION_WAIT_TIMEOUT = 3  # Seconds /ai/moderate holds a request for a flagged item's batch
+    MODERATION_WAIT_POLL = 0.05  # Seconds between checks while it waits
+    MODERATION_REPEAT_THRESHOLD = 3  # Identical texts from one sender before they count as spam
+    MODERATION_REPEAT_WINDOW = 10000  # Recent (sender, text) pairs remembered per worker
@@ -2,7 +2,7 @@
 Database migration script to add AI feature tables
 """
 from app import create_app, db
-from app.models import CompatibilityAnalysis, AIConversationStarter, DateIdea, ContentModeration, ProfileInsight
+from app.models import CompatibilityAnalysis, AIConversationStarter, DateIdea, ContentModeration, ProfileInsight, AIResultCacheEntry, AIJob
 
 def migrate():
     app = create_app()
@@ -15,6 +15,8 @@ def migrate():
         print("   - date_ideas")
         print("   - content_moderations")
         print("   - profile_insights")
+        print("   - ai_result_cache")
+        print("   - ai_jobs")
 
 if __name__ == '__main__':
     migrate()
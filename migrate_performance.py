@@ -0,0 +1,88 @@
+"""
+Database migration script for the performance tables and indexes
+"""
+from app import create_app, db
+from app.models import User, Like, Match, ConversationSummary, SeenSet, UnreadCounter
+from app.search_index import search_index
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+
+
+def create_indexes():
+    """create_all() only creates indexes for new tables, so add them explicitly"""
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_matches_user2_id ON matches (user2_id)",
+        "CREATE INDEX IF NOT EXISTS ix_profiles_user_id ON profiles (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_users_active_dob ON users (is_active, date_of_birth)",
+        "CREATE INDEX IF NOT EXISTS ix_profiles_experience_collaboration "
+        "ON profiles (experience_level, collaboration_interest, user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_messages_pair_sent ON messages (sender_id, receiver_id, sent_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_notifications_user_read ON notifications (user_id, is_read)",
+        "CREATE INDEX IF NOT EXISTS ix_messages_receiver_read ON messages (receiver_id, is_read)",
+    ]
+    with db.engine.connect() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+        conn.commit()
+    print("✓ Indexes created")
+
+
+def backfill_conversation_summaries():
+    """Create a summary row for every match that doesn't have one yet"""
+    created = 0
+    for match in Match.query.all():
+        summary = ConversationSummary.query.filter_by(
+            user1_id=match.user1_id,
+            user2_id=match.user2_id
+        ).first()
+        if summary is None:
+            summary = ConversationSummary.for_pair(match.user1_id, match.user2_id)
+            summary.refresh()
+            created += 1
+    db.session.commit()
+    print(f"✓ Backfilled {created} conversation summaries")
+
+
+def backfill_seen_sets():
+    """Seed each user's seen-set from the likes they have already sent"""
+    liked = {}
+    for liker_id, liked_id in db.session.query(Like.liker_id, Like.liked_id):
+        liked.setdefault(liker_id, []).append(liked_id)
+    for liker_id, liked_ids in liked.items():
+        SeenSet.record(liker_id, *liked_ids)
+    db.session.commit()
+    print(f"✓ Backfilled seen-sets for {len(liked)} users")
+
+
+def rebuild_search_index():
+    """Index every user's profile text for /search"""
+    if not search_index.enabled:
+        print("• Full-text search needs SQLite FTS5, skipping index rebuild")
+        return
+    db.session.execute(text(f"DELETE FROM {search_index.TABLE}"))
+    users = User.query.options(joinedload(User.profile)).all()
+    search_index.rebuild(users)
+    db.session.commit()
+    print(f"✓ Indexed {len(users)} profiles for search")
+
+
+def backfill_unread_counters():
+    """Compute the navbar unread counters from messages and notifications"""
+    repaired = UnreadCounter.reconcile()
+    print(f"✓ Backfilled {repaired} unread counters")
+
+
+def migrate():
+    app = create_app()
+    with app.app_context():
+        # New tables are created by create_app()
+        create_indexes()
+        backfill_conversation_summaries()
+        backfill_seen_sets()
+        rebuild_search_index()
+        backfill_unread_counters()
+        print("\n✅ Performance migration completed successfully!")
+
+
+if __name__ == '__main__':
+    migrate()
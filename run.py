@@ -1,3 +1,9 @@
+if __name__ == '__main__':
+    # socketio.run serves on eventlet; patch before the app imports threading and
+    # socket, so background tasks and blocking waits yield to the hub as under gunicorn
+    import eventlet
+    eventlet.monkey_patch()
+
 from app import create_app, socketio
 
 app = create_app()
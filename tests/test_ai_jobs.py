@@ -0,0 +1,75 @@
+"""
+Background AI jobs: a job whose generation falls back to canned output must be
+retried, not counted as done, and the fallback must never reach ai_result_cache.
+"""
+import tempfile
+from datetime import date
+
+import pytest
+
+from config import Config
+from app import create_app, db
+from app.models import User, Profile, Like, AIJob, AIResultCacheEntry
+from app.ai_cache import ai_cache, cached_conversation_starters
+from app.ai_jobs import ai_jobs
+from app.groq_service import groq_service
+
+
+class AppTestConfig(Config):
+    SQLALCHEMY_DATABASE_URI = f'sqlite:///{tempfile.mkdtemp()}/test.db'
+    WTF_CSRF_ENABLED = False
+
+
+@pytest.fixture
+def app():
+    app = create_app(AppTestConfig)
+    with app.app_context():
+        users = []
+        for name in ('alice', 'bob'):
+            user = User(username=name, email=f'{name}@techbuddy.dev', gender='Other',
+                        date_of_birth=date(1995, 1, 1))
+            user.set_password('password')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Profile(user_id=user.id, bio='hi'))
+            users.append(user)
+        alice, bob = users
+        db.session.add_all([Like(liker_id=alice.id, liked_id=bob.id),
+                            Like(liker_id=bob.id, liked_id=alice.id)])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+    ai_cache._entries.clear()
+
+
+@pytest.fixture
+def groq_down(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('Groq API error: service unavailable')
+    monkeypatch.setattr(groq_service, '_call_groq', fail)
+
+
+def test_cached_call_reports_fallback(app, groq_down):
+    alice, bob = User.query.order_by(User.id).all()
+    result, used_fallback = groq_service.call_tracked(cached_conversation_starters, alice, bob)
+    assert result is not None
+    assert used_fallback
+    assert AIResultCacheEntry.query.count() == 0
+
+
+@pytest.mark.parametrize('kind', ['conversation_starters', 'compatibility'])
+def test_job_without_real_result_is_retried(app, groq_down, kind):
+    alice, bob = User.query.order_by(User.id).all()
+    db.session.add(AIJob(kind=kind, user_id=alice.id, other_id=bob.id))
+    db.session.commit()
+
+    (job_id,) = ai_jobs.claim(1)
+    ai_jobs.run(job_id)
+
+    job = db.session.get(AIJob, job_id)
+    assert job is not None
+    assert job.status == 'pending'
+    assert job.attempts == 1
+    assert 'Groq unavailable' in job.error
+    assert AIResultCacheEntry.query.count() == 0